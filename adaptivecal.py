@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive calibration of the stimulus intensity.
+
+Replaces the linear 1..149 sweep of calibration(). Intensities still only
+go up, as the participants are told, but the step size adapts:
+
+1. Detection: the intensity rises by detectStep until the participant
+   feels the stimulus.
+2. Rating: a grid posterior over the model curveFit() uses,
+   VAS = 50 * exp(b * (x - x50)), is updated after every rating (Gaussian
+   rating noise, ratings of 0 treated as censored). The next intensity aims
+   at the lowest of the VAS 40/50/60/70 intensities still above the last
+   stimulus, limited to a rise of maxRise (relative) / maxStep (absolute)
+   and to the hard ceiling. Near the top of the curve the steps are small,
+   so the series does not overshoot the stop rating: after a rating of
+   cautionVAS or more the rise is at most cautionStep, and the next
+   intensity stays stopSD posterior SDs below the VAS 70 intensity (but
+   always rises by at least minStep).
+
+The series stops at a rating >= stopVAS (as before), at the ceiling, or once
+the VAS 40/50/60 intensities are known to within `tolerance` units.
+
+Run this file to compare the number of stimuli, the VAS 50 error and the
+highest and last ratings with the linear sweep on synthetic participants.
+"""
+import math
+
+import numpy as np
+from scipy.special import log_ndtr
+
+from participantmodel import SyntheticParticipant
+
+ceiling = 149       # hard intensity ceiling (1 = 0.1 mA), as in the linear sweep
+targets = (40, 50, 60)
+stopVAS = 70
+
+
+class AdaptiveCalibration:
+
+    def __init__(self, start=1, ceiling=ceiling, detectStep=3, minStep=1, maxStep=4, maxRise=0.25,
+                 cautionVAS=30, cautionStep=3, stopSD=1, targets=targets, stopVAS=stopVAS, noiseSD=10, tolerance=3, minRated=4):
+        self.ceiling = ceiling
+        self.detectStep = detectStep
+        self.minStep = minStep
+        self.maxStep = maxStep
+        self.maxRise = maxRise
+        self.cautionVAS = cautionVAS
+        self.cautionStep = cautionStep
+        self.stopSD = stopSD
+        self.targets = np.array(targets + (stopVAS,), dtype=float)
+        self.stopVAS = stopVAS
+        self.noiseSD = noiseSD
+        self.tolerance = tolerance
+        self.minRated = minRated
+
+        # parameter grid: x50 in stimulus units, b log-spaced
+        x50, b = np.meshgrid(np.arange(1, 301, 1.0), np.geomspace(0.005, 0.5, 60), indexing='ij')
+        self.x50 = x50.ravel()
+        self.b = b.ravel()
+        self.logPost = np.zeros(self.x50.size)     # flat prior
+        self.xTargets = self.x50[:, None] + np.log(self.targets / 50)[None, :] / self.b[:, None]
+
+        self.nextIntensity = min(int(start), ceiling)
+        self.detected = False
+        self.nRated = 0
+        self.done = False
+
+    def next(self):
+        # intensity of the next stimulus, or None when the series is finished
+        return None if self.done else self.nextIntensity
+
+    def update(self, intensity, rating):
+        # rating None = stimulus not felt
+        if rating is None:
+            if self.detected:
+                raise ValueError('a rating is needed once the stimulus was felt')
+            self._setNext(intensity + self.detectStep)
+            return
+
+        self.detected = True
+        self.nRated += 1
+        mu = np.minimum(50 * np.exp(self.b * (intensity - self.x50)), 100)
+        if rating <= 0:
+            self.logPost += log_ndtr((0.5 - mu) / self.noiseSD)
+        else:
+            self.logPost -= 0.5 * ((rating - mu) / self.noiseSD) ** 2
+        self.logPost -= self.logPost.max()
+
+        if rating >= self.stopVAS:
+            self.done = True
+            return
+        mean, sd = self.estimates()
+        if self.nRated >= self.minRated and np.all(sd[:-1] < self.tolerance):
+            self.done = True
+            return
+
+        # aim at the lowest target intensity still above the last stimulus
+        above = mean[mean > intensity]
+        aim = above.min() if len(above) else mean[-1]
+        limit = min(self.maxStep, round(self.maxRise * intensity))
+        if rating >= self.cautionVAS:
+            limit = min(limit, self.cautionStep)    # near the top of the curve a large step overshoots stopVAS
+        limit = min(limit, math.floor(mean[-1] - self.stopSD * sd[-1]) - intensity)     # below the VAS 70 intensity
+        step = min(max(round(aim) - intensity, self.minStep), max(self.minStep, limit))
+        self._setNext(intensity + step)
+
+    def _setNext(self, intensity):
+        if intensity > self.ceiling:
+            self.done = True
+        self.nextIntensity = int(min(intensity, self.ceiling))
+
+    def estimates(self):
+        # posterior mean and sd of the VAS 40/50/60/70 intensities
+        weights = np.exp(self.logPost)
+        weights /= weights.sum()
+        mean = weights @ self.xTargets
+        sd = np.sqrt(weights @ (self.xTargets - mean) ** 2)
+        return mean, sd
+
+###############################################################################
+# %% Comparison with the linear sweep on synthetic participants
+###############################################################################
+
+def runLinearSweep(participant):
+    # the original procedure: 1, 2, 3, ... until a rating >= 70
+    intensities, ratings = [], []
+    nStimuli = 0
+    for stim in range(1, ceiling + 1):
+        nStimuli += 1
+        if not ratings and not participant.feels(stim):
+            continue
+        rating = participant.rate(stim)
+        intensities.append(stim)
+        ratings.append(rating)
+        if rating >= stopVAS:
+            break
+    return nStimuli, intensities, ratings
+
+def runAdaptive(participant, **kwargs):
+    engine = AdaptiveCalibration(**kwargs)
+    intensities, ratings = [], []
+    nStimuli = 0
+    stim = engine.next()
+    while stim is not None:
+        nStimuli += 1
+        if not ratings and not participant.feels(stim):
+            engine.update(stim, None)
+        else:
+            rating = participant.rate(stim)
+            intensities.append(stim)
+            ratings.append(rating)
+            engine.update(stim, rating)
+        stim = engine.next()
+    return nStimuli, intensities, ratings
+
+def fitVAS50(intensities, ratings):
+    # log-linear least squares on the positive ratings
+    x = np.array(intensities, dtype=float)
+    y = np.array(ratings, dtype=float)
+    x, y = x[y > 0], y[y > 0]
+    if len(x) < 2 or np.ptp(x) == 0:
+        return np.nan
+    b, logA = np.polyfit(x, np.log(y), 1)
+    return (np.log(50) - logA) / b if b > 0 else np.nan
+
+def compareWithSweep(nParticipants=200, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {'linear sweep': [], 'adaptive': []}
+    for i in range(nParticipants):
+        participant = SyntheticParticipant.random(rng)
+        trueX50 = participant.intensityFor(50)
+        for name, run in (('linear sweep', runLinearSweep), ('adaptive', runAdaptive)):
+            # two series per participant, as in the experiment
+            series = [run(participant), run(participant)]
+            nStimuli = sum(s[0] for s in series)
+            x50 = fitVAS50(series[0][1] + series[1][1], series[0][2] + series[1][2])
+            maxRating = max(max(s[2], default=0) for s in series)
+            lastRating = np.mean([s[2][-1] if s[2] else 0 for s in series])
+            results[name].append((nStimuli, abs(x50 - trueX50), maxRating, lastRating))
+
+    for name, rows in results.items():
+        rows = np.array(rows)
+        print('%-13s stimuli per participant: median %5.1f, p90 %5.1f, max %3i   |VAS 50 error| median %.1f units'
+              % (name, np.median(rows[:, 0]), np.percentile(rows[:, 0], 90), rows[:, 0].max(), np.nanmedian(rows[:, 1])))
+        print('%-13s highest rating: median %4.1f, p90 %4.1f, max %5.1f, >= 90 in %4.1f %%   last rating: median %4.1f'
+              % ('', np.median(rows[:, 2]), np.percentile(rows[:, 2], 90), rows[:, 2].max(),
+                 100 * np.mean(rows[:, 2] >= 90), np.median(rows[:, 3])))
+
+
+if __name__ == '__main__':
+    compareWithSweep()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Combines the raw participant files into analysis-ready tables.
+
+Every participant (trial CSV + _CAL.csv) is parsed in a process pool. The
+parsed results are kept in a manifest together with the mtime, size and
+SHA-1 of the files they came from, so later runs only parse new or changed
+participants. One pass writes:
+    K5_long.csv     one row per trial
+    K5_wide.csv     one row per participant: calibration fit and the mean
+                    rating of every block type and color
+    K5_wide.sav     SPSS file (needs pyreadstat); without pyreadstat,
+                    K5_wide.sps reads K5_wide.csv into SPSS instead
+
+    python aggregate.py [data directory] [--out DIR] [--workers N] [--full]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from callog import readCalibration
+from expfit import fitExponential
+from trialstore import isTrialCSV, readTrialCSV
+
+# SPSS export is optional
+try:
+    import pyreadstat
+except ImportError:
+    pyreadstat = None
+
+manifestName = 'aggregate_manifest.json'
+manifestVersion = 2     # increase when parseParticipant() changes, to reparse everything
+
+longColumns = ['subID', 'group', 'blockType', 'blockCounter', 'bcgColor', 'marker', 'VAS']
+
+###############################################################################
+# %% Parsing one participant (worker process)
+###############################################################################
+
+def fileState(path):
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': fileHash(path)}
+
+def fileHash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as dataFile:
+        for chunk in iter(lambda: dataFile.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def parseParticipant(csvPath):
+    # trials, calibration fit and the intensities estimated during the session
+    trials = readTrialCSV(csvPath)
+    result = {'subID': os.path.basename(csvPath).split('_')[0],
+              'group': str(trials['group'][0]) if len(trials) else '',
+              'trials': [list(trial) for trial in trials.tolist()],
+              'calibration': None}
+
+    calPath = csvPath[:-len('.csv')] + '_CAL.csv'
+    if os.path.exists(calPath):
+        x, y, estimates = readCalibration(calPath)
+        a = b = None
+        if len(x) >= 2:
+            try:
+                a, b = (float(v) for v in fitExponential(x, y))
+            except (RuntimeError, ValueError):
+                print('Calibration fit failed for', calPath)
+        estimations = {'estimation%i' % target: value for target, value in estimates.items()}
+        result['calibration'] = dict(points=len(x), a=a, b=b, **estimations)
+    return result
+
+###############################################################################
+# %% Manifest
+###############################################################################
+
+def participantFiles(dataDir):
+    # trial CSV and, if present, _CAL.csv of every participant
+    files = {}
+    for csvPath in sorted(glob.glob(os.path.join(dataDir, '*.csv'))):
+        if isTrialCSV(csvPath):
+            calPath = csvPath[:-len('.csv')] + '_CAL.csv'
+            files[csvPath] = [csvPath] + ([calPath] if os.path.exists(calPath) else [])
+    return files
+
+def loadManifest(path):
+    if os.path.exists(path):
+        with open(path, encoding='utf8') as manifestFile:
+            manifest = json.load(manifestFile)
+        if manifest.get('version') == manifestVersion:
+            return manifest
+    return {'version': manifestVersion, 'participants': {}}
+
+def saveManifest(manifest, path):
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'w', encoding='utf8') as manifestFile:
+        json.dump(manifest, manifestFile)
+    os.replace(tmpPath, path)
+
+def unchanged(entry, paths):
+    # True if the files are the ones the entry was parsed from; the hash is
+    # only computed for files whose mtime or size changed (and updated if equal)
+    if entry is None or sorted(entry['files']) != sorted(os.path.basename(p) for p in paths):
+        return False
+    for path in paths:
+        state = entry['files'][os.path.basename(path)]
+        stat = os.stat(path)
+        if stat.st_mtime == state['mtime'] and stat.st_size == state['size']:
+            continue
+        if stat.st_size != state['size'] or fileHash(path) != state['sha1']:
+            return False
+        state['mtime'] = stat.st_mtime    # touched, same content
+    return True
+
+###############################################################################
+# %% Tables
+###############################################################################
+
+def longTable(results):
+    return [trial for result in results for trial in result['trials']]
+
+def wideTable(results):
+    # one row per participant; mean rating per block type and color
+    cells = sorted({(trial[2], trial[4]) for result in results for trial in result['trials']})
+    columns = ['subID', 'group', 'calPoints', 'calA', 'calB', 'estimation40', 'estimation50', 'estimation60']
+    columns += ['%s_%s' % cell for cell in cells]
+    rows = []
+    for result in results:
+        calibration = result['calibration'] or {}
+        row = [result['subID'], result['group'], calibration.get('points'), calibration.get('a'), calibration.get('b'),
+               calibration.get('estimation40'), calibration.get('estimation50'), calibration.get('estimation60')]
+        ratings = {}
+        for trial in result['trials']:
+            ratings.setdefault((trial[2], trial[4]), []).append(trial[6])
+        for cell in cells:
+            values = np.array(ratings.get(cell, []), dtype=float)
+            row.append(float(np.nanmean(values)) if np.any(~np.isnan(values)) else None)
+        rows.append(row)
+    return columns, rows
+
+def writeCSV(path, columns, rows):
+    def cell(value):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return ''
+        return str(value)
+    with open(path, 'w', encoding='utf8') as outFile:
+        outFile.write(','.join(columns) + '\n')
+        for row in rows:
+            outFile.write(','.join(cell(value) for value in row) + '\n')
+
+def writeSPSS(outDir, columns, rows):
+    # .sav with pyreadstat; otherwise SPSS syntax that reads K5_wide.csv
+    if pyreadstat is not None:
+        import pandas as pd     # pyreadstat depends on pandas
+        path = os.path.join(outDir, 'K5_wide.sav')
+        pyreadstat.write_sav(pd.DataFrame(rows, columns=columns), path)
+        return path
+
+    path = os.path.join(outDir, 'K5_wide.sps')
+    textColumns = {'subID', 'group'}
+    with open(path, 'w', encoding='utf8') as syntax:
+        syntax.write('* Reads K5_wide.csv (written by aggregate.py). pyreadstat was not installed, so no .sav was written.\n')
+        syntax.write("GET DATA /TYPE=TXT\n  /FILE='K5_wide.csv'\n  /ENCODING='UTF8'\n  /DELIMITERS=','\n")
+        syntax.write('  /ARRANGEMENT=DELIMITED\n  /FIRSTCASE=2\n  /VARIABLES=\n')
+        for column in columns:
+            syntax.write('    %s %s\n' % (column, 'A32' if column in textColumns else 'F8.3'))
+        syntax.write('.\nEXECUTE.\n')
+    return path
+
+###############################################################################
+# %% Run
+###############################################################################
+
+def aggregate(dataDir, outDir=None, workers=None, full=False):
+    outDir = outDir or dataDir
+    os.makedirs(outDir, exist_ok=True)
+    manifestPath = os.path.join(outDir, manifestName)
+    manifest = {'version': manifestVersion, 'participants': {}} if full else loadManifest(manifestPath)
+    entries = manifest['participants']
+
+    files = participantFiles(dataDir)
+    toParse = [csvPath for csvPath, paths in files.items() if not unchanged(entries.get(os.path.basename(csvPath)), paths)]
+    for name in set(entries) - {os.path.basename(csvPath) for csvPath in files}:
+        del entries[name]   # participant files removed
+
+    if toParse:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for csvPath, result in zip(toParse, pool.map(parseParticipant, toParse, chunksize=8)):
+                entries[os.path.basename(csvPath)] = {
+                    'files': {os.path.basename(path): fileState(path) for path in files[csvPath]},
+                    'result': result}
+    saveManifest(manifest, manifestPath)
+    print('%i participants, %i parsed, %i unchanged' % (len(files), len(toParse), len(files) - len(toParse)))
+
+    results = [entries[name]['result'] for name in sorted(entries)]
+    writeCSV(os.path.join(outDir, 'K5_long.csv'), longColumns, longTable(results))
+    columns, rows = wideTable(results)
+    writeCSV(os.path.join(outDir, 'K5_wide.csv'), columns, rows)
+    return writeSPSS(outDir, columns, rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dataDir', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'K5_data'))
+    parser.add_argument('--out', default=None, help='output folder (default: the data folder)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and parse every file')
+    args = parser.parse_args()
+    print('Saved', aggregate(args.dataDir, args.out, args.workers, args.full))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Flat full-screen background color.
+
+In 'clear' mode the color is the window clear color: flip() clears the back
+buffer to it, so drawing the background costs nothing per frame. In
+'grating' mode a full-window GratingStim is drawn every frame (the original
+approach, kept for comparison and as a fallback). Both modes have the
+setColor()/draw() interface of the grating, so the trial loops are the same.
+"""
+
+backgroundModes = ('clear', 'grating')
+
+
+class Background:
+
+    def __init__(self, win, grating, mode='clear', color='black'):
+        if mode not in backgroundModes:
+            raise ValueError('mode must be one of %s' % list(backgroundModes))
+        self.win = win
+        self.grating = grating
+        self.mode = mode
+        self.defaultColor = color   # window color outside the trials (instructions)
+
+    def setColor(self, color, colorSpace='rgb'):
+        if self.mode == 'grating':
+            self.grating.setColor(color, colorSpace=colorSpace)
+            return
+        self.win.color = color  # colorSpace of the window ('rgb')
+        self.win.clearBuffer()  # the back buffer was cleared to the previous color at the last flip
+
+    def draw(self):
+        if self.mode == 'grating':
+            self.grating.draw()
+
+    def reset(self):
+        # back to the default window color before the next instruction screen
+        if self.mode == 'clear':
+            self.setColor(self.defaultColor)
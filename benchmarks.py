@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the hot paths of the experiment.
+
+Every benchmark runs in isolation against stand-in devices (simulation.py)
+on the wall clock. Without psychopy, the marker dispatcher and stimulation
+scheduler run on the simulated psychopy modules with a wall-clock core; the
+benchmarks that need a real window (rating scale setup, per-frame draw
+cost, cached rating screens, background modes) are skipped.
+Results are saved as JSON in bench_results/ (not under version control) and
+compared with the previous run; a median more than 20 % slower is reported
+as a regression.
+
+    python benchmarks.py [--repeat N] [--only name,name] [--out DIR]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+try:
+    import psychopy
+    hasPsychopy = True
+except ImportError:
+    hasPsychopy = False     # simulated modules from useStandIns()
+
+import checkpoint
+import simulation
+from datawriter import TrialWriter
+from expfit import fitExponential, bootstrapIntervals
+from labjackio import DryRunU3, TriggerOutput
+from participantmodel import SyntheticParticipant
+from ratingtrace import RatingTrace
+from telemetry import TelemetryPublisher
+
+regressionFactor = 1.2
+
+###############################################################################
+# %% Helpers
+###############################################################################
+
+def timeCalls(func, n):
+    # call func n times and return the duration of every call in ms
+    durations = np.empty(n)
+    for i in range(n):
+        start = time.perf_counter()
+        func()
+        durations[i] = (time.perf_counter() - start) * 1000
+    return durations
+
+def cpuTimes(func, n):
+    # process CPU time of every call in ms (all threads; a flip waiting for vsync should not count)
+    durations = np.empty(n)
+    for i in range(n):
+        start = time.process_time()
+        func()
+        durations[i] = (time.process_time() - start) * 1000
+    return durations
+
+def summarize(durations):
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+    return {'n': len(durations), 'median': p50, 'p95': p95, 'p99': p99, 'max': float(np.max(durations))}
+
+def report(name, stats, previous=None):
+    line = '%-45s median %8.3f ms   p95 %8.3f ms   p99 %8.3f ms   max %8.3f ms' % (
+        name, stats['median'], stats['p95'], stats['p99'], stats['max'])
+    if previous and name in previous:
+        ratio = stats['median'] / previous[name]['median'] if previous[name]['median'] else 1
+        line += '   %+6.1f %%' % ((ratio - 1) * 100)
+        if ratio > regressionFactor:
+            line += '   REGRESSION'
+    print(line)
+
+
+class WallClock:
+    # stand-in devices timestamp their writes with this clock
+    now = staticmethod(time.perf_counter)
+
+
+class SlowSerial(simulation.Serial):
+    """Stand-in serial port with a fixed write latency."""
+
+    def __init__(self, latency=0.001):
+        super().__init__()
+        self.latency = latency
+
+    def write(self, data):
+        time.sleep(self.latency)
+        return super().write(data)
+
+
+def useStandIns():
+    # without psychopy its simulated modules, with core on the wall clock (waits sleep in every thread)
+    if not hasPsychopy:
+        simulation.install()
+        core = sys.modules['psychopy.core']
+        core.getTime = time.perf_counter
+        core.wait = lambda secs, hogCPUperiod=0.2: time.sleep(secs)
+    simulation.clock = WallClock()
+    rng = np.random.default_rng(0)
+    simulation.subject = simulation.SimulatedSubject(SyntheticParticipant.random(rng), rng)
+
+###############################################################################
+# %% Benchmarks on stand-in backends
+###############################################################################
+
+def benchFileAppend(n, dataDir):
+    # per-trial open/append/close (old) vs. enqueue to the background writer
+    path = os.path.join(dataDir, 'bench_trials.csv')
+    row = 'congruent,intensity,1,red,31,55\n'
+
+    def appendRow():
+        dataFile = open(path, 'a')
+        dataFile.write(row)
+        dataFile.close()
+
+    results = {'trial file open/append/close': summarize(timeCalls(appendRow, n))}
+    writer = TrialWriter(flushPolicy='block', journalDir=dataDir)
+    results['trial writer enqueue'] = summarize(timeCalls(lambda: writer.write(path, row), n))
+    writer.close()
+    os.remove(path)
+    return results
+
+def benchCheckpoint(n, dataDir):
+    # experiment-thread cost of a checkpoint late in a session (encode + enqueue); the writer thread does the I/O
+    rng = np.random.default_rng(0)
+    state = types.SimpleNamespace(**{field: None for field in checkpoint.stateFields})
+    state.__dict__.update(subID='P01', group='congruent', expDate='2023-01-01_10h00.00.000000', seed=12345,
+                          calStart=1, calSeries=2, calSteps=[[i, int(i * 2)] for i in range(14)],
+                          calThresholds=[5, 6], stimIntTotal=list(range(5, 33)), stimVASTotal=list(rng.integers(0, 70, 28)),
+                          estimationVAS40=np.float64(20.1), estimationVAS50=np.float64(24.2), estimationVAS60=np.float64(27.9),
+                          estimationVAS=np.float64(24.2), baselineRatings=list(rng.integers(0, 100, 12)), baselineMean=50.0,
+                          completed=['practice', 'calibration1', 'calibration2', 'curveFit', 'baseline'], phase='intensity',
+                          trialsDone=30, resumes=0, finished=False, trialRows=52, calRows=36)
+    path = os.path.join(dataDir, 'bench_CHECKPOINT.json')
+    writer = TrialWriter(flushPolicy='block', journalDir=dataDir)
+    results = {'checkpoint (encode + enqueue)': summarize(timeCalls(lambda: writer.replace(path, checkpoint.encode(state)), n))}
+    writer.close()
+    os.remove(path)
+    return results
+
+def benchSerialMarker(n):
+    ser = SlowSerial()
+    results = {'serial marker write (1 ms port, blocking)': summarize(timeCalls(lambda: ser.write(b'31'), n))}
+    from biopacmarkers import MarkerDispatcher
+    markers = MarkerDispatcher(ser, win=None)
+    results['marker dispatcher send'] = summarize(timeCalls(lambda: markers.send('31'), n))
+    markers.close()
+    return results
+
+def benchPulseTrain(n):
+    # pulse train as in electricalStim(3): run(), then two register writes per further pulse, 0.2 s apart
+    electricShock = simulation.DS8R(demand=10)
+    trigger = simulation.U3()
+    TRIG = 6701
+    blocked, intervals = [], []
+    for i in range(n):
+        trigger.writes.clear()
+        start = time.perf_counter()
+        electricShock.run()
+        time.sleep(0.2)
+        for pulse in range(2):
+            trigger.writeRegister(TRIG, 65280 + 255)
+            trigger.writeRegister(TRIG, 65280 + 0)
+            time.sleep(0.2)
+        blocked.append((time.perf_counter() - start) * 1000)
+        rising = [t for t, addr, value in trigger.writes if value == 65280 + 255]
+        intervals += list(np.diff([electricShock.pulses[-1][0]] + rising) * 1000)
+    results = {'pulse train, main thread blocked': summarize(np.array(blocked)),
+               'pulse train, inter-pulse interval': summarize(np.array(intervals))}
+
+    # the same train from the stimulation thread
+    from stimulation import StimulationScheduler
+    stimulator = StimulationScheduler(electricShock, TriggerOutput(DryRunU3()))
+    blocked, intervals = [], []
+    for i in range(n):
+        start = time.perf_counter()
+        train = stimulator.start(10, 3)
+        blocked.append((time.perf_counter() - start) * 1000)
+        train.wait()
+        intervals += list(np.diff(train.pulseTs) * 1000)
+    stimulator.close()
+    results['scheduled pulse train, main thread blocked'] = summarize(np.array(blocked))
+    results['scheduled pulse train, inter-pulse interval'] = summarize(np.array(intervals))
+    return results
+
+def benchLabJack(n):
+    # trigger pulse on a device with 1 ms per USB round trip: two register writes vs. one feedback transaction
+    device = DryRunU3(latency=0.001)
+    trigger = TriggerOutput(device)
+
+    def registerPulse():
+        device.writeRegister(6701, 65280 + 255)
+        device.writeRegister(6701, 65280 + 0)
+
+    results = {'LabJack pulse, 2 register writes (1 ms USB)': summarize(timeCalls(registerPulse, n)),
+               'LabJack pulse, 1 feedback packet (1 ms USB)': summarize(timeCalls(trigger.pulse, n))}
+    trigger.latencies.clear()
+    return results
+
+def benchRatingTrace(n):
+    # per-frame cost of the slider trace (in the rating loop) and the row formatting at the end of a 4 s rating
+    trace = RatingTrace(60)
+    frame = iter(range(10**9))
+    results = {'rating trace, record one frame': summarize(timeCalls(lambda: trace.record(next(frame) / 60, 42.0), n))}
+    trace.start()
+    for i in range(240):
+        trace.record(i / 60, i / 2.4)
+    results['rating trace, row of 240 frames'] = summarize(timeCalls(lambda: trace.row('intensity', 1, 'red', 50, 4.0), n))
+    return results
+
+def benchTelemetry(n):
+    # time in the trial loop to publish a trial row; nobody listens on the port
+    telemetry = TelemetryPublisher(('127.0.0.1', 47899))
+
+    def publishTrial():
+        telemetry.publish('trial', blockType='intensity', blockCounter=1, label='red', marker='31', rating=50)
+
+    results = {'telemetry publish (no subscriber)': summarize(timeCalls(publishTrial, n))}
+    telemetry.close()
+    return results
+
+def benchCurveFit(n):
+    rng = np.random.default_rng(1)
+    participant = SyntheticParticipant.random(rng)
+    x = np.arange(int(participant.threshold) + 1, int(participant.intensityFor(70)) + 1, 2)
+    y = np.array([participant.rate(xi) for xi in x])
+    a, b = fitExponential(x, y)
+    bootstrap = lambda: bootstrapIntervals(x, y, a, b, budget=np.inf)    # all 1000 resamples, budget 0.2 s in the session
+    return {'curve fit (%i points)' % len(x): summarize(timeCalls(lambda: fitExponential(x, y), n)),
+            'bootstrap CI (1000 resamples)': summarize(timeCalls(bootstrap, max(1, n // 10)))}
+
+###############################################################################
+# %% Benchmarks that need a real window
+###############################################################################
+
+def benchWindow(n):
+    if not hasPsychopy:
+        print('psychopy not installed: skipping rating scale and draw benchmarks')
+        return {}
+    from psychopy import visual
+    from ratingscales import RatingScalePool, buildRatingScale
+
+    win = visual.Window(size=[2560, 1440], fullscr=False, winType='pyglet', allowGUI=False,
+                        monitor='testMonitor', color='black', colorSpace='rgb', units='norm')
+    results = {}
+    pool = RatingScalePool(win)
+    for style in ('grey', 'black'):
+        results['rating scale rebuild (%s)' % style] = summarize(timeCalls(lambda: buildRatingScale(win, style), n))
+        results['rating scale pool reset (%s)' % style] = summarize(timeCalls(lambda: pool.get(style), n))
+
+    # one frame of a rating screen: background grating, question and scale
+    slideColor = visual.GratingStim(win=win, units='norm', tex=None, mask=None, size=(2, 2), sf=None,
+                                    color=[1, -1, -1], colorSpace='rgb', blendmode='avg', texRes=128)
+    question = visual.TextStim(win=win, text='Oceń jak bardzo bolesna była ta seria bodźców',
+                               font='Arial', pos=(0, 0.5), height=0.15, wrapWidth=1.5, color='black')
+    ratingScale = pool.get('black')
+
+    def drawFrame():
+        slideColor.draw()
+        question.draw()
+        ratingScale.draw()
+        win.flip()
+
+    results['rating screen frame (draw + flip)'] = summarize(timeCalls(drawFrame, n))
+
+    # the same frame from the cached static layer (ratingscreen.py)
+    from ratingscreen import drawDynamic, splitElements
+    elements, static, live = splitElements(ratingScale)
+    layer = visual.BufferImageStim(win, stim=[slideColor, question] + static)
+
+    def drawCachedFrame():
+        layer.draw()
+        drawDynamic(ratingScale, elements, live)
+        win.flip()
+
+    results['rating screen frame (cached layer)'] = summarize(timeCalls(drawCachedFrame, n))
+    for name, frame in (('full redraw', drawFrame), ('cached layer', drawCachedFrame)):
+        results['rating screen CPU per frame (%s)' % name] = summarize(cpuTimes(frame, n))
+
+    # render cost of a flat background per frame: draw calls until the GPU is done (glFinish), flip not timed
+    from pyglet import gl
+    from background import Background
+    for mode in ('grating', 'clear'):
+        background = Background(win, slideColor, mode=mode)
+        background.setColor([1, -1, -1])
+
+        def renderBackground():
+            background.draw()
+            gl.glFinish()
+
+        durations = np.empty(n)
+        for i in range(n):
+            durations[i] = timeCalls(renderBackground, 1)[0]
+            win.flip()
+        results['background render (%s)' % mode] = summarize(durations)
+        background.reset()
+    win.close()
+    return results
+
+###############################################################################
+# %% Run
+###############################################################################
+
+benchmarks = {
+    'fileAppend': lambda n, args: benchFileAppend(n, args.dataDir),
+    'serialMarker': lambda n, args: benchSerialMarker(n),
+    'checkpoint': lambda n, args: benchCheckpoint(n, args.dataDir),
+    'pulseTrain': lambda n, args: benchPulseTrain(max(n // 20, 5)),
+    'labJack': lambda n, args: benchLabJack(n),
+    'ratingTrace': lambda n, args: benchRatingTrace(n),
+    'telemetry': lambda n, args: benchTelemetry(n),
+    'curveFit': lambda n, args: benchCurveFit(n),
+    'window': lambda n, args: benchWindow(n),
+}
+
+def loadPrevious(outDir):
+    runs = sorted(glob.glob(os.path.join(outDir, 'bench_*.json')))
+    if not runs:
+        return None
+    with open(runs[-1], encoding='utf8') as runFile:
+        return json.load(runFile)['results']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--only', default='', help='comma-separated benchmark names: ' + ', '.join(benchmarks))
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results'))
+    parser.add_argument('--dataDir', default=tempfile.gettempdir(), help='folder for the file append benchmark (e.g. K5_data)')
+    args = parser.parse_args()
+
+    useStandIns()
+    previous = loadPrevious(args.out)
+    results = {}
+    for name, bench in benchmarks.items():
+        if args.only and name not in args.only.split(','):
+            continue
+        for label, stats in bench(args.repeat, args).items():
+            report(label, stats, previous)
+            results[label] = stats
+
+    os.makedirs(args.out, exist_ok=True)
+    outPath = os.path.join(args.out, time.strftime('bench_%Y%m%d_%H%M%S.json'))
+    with open(outPath, 'w', encoding='utf8') as outFile:
+        json.dump({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, outFile, indent=1)
+    print('Saved', outPath)
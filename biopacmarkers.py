@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Non-blocking Biopac marker dispatcher.
+
+Serial writes run on an I/O thread, so a slow write never delays a flip.
+sendOnFlip() queues a marker the moment the next win.flip() returns, so its
+onset is tied to the screen onset rather than to the moment it was
+requested. Every marker is logged with host timestamps (core.getTime()):
+requested, flip (for markers sent on flip), write start and write end.
+Written markers are also published to the live telemetry (telemetry.py)
+from the I/O thread. A failed write is printed and logged with writeEndT
+NaN; the thread goes on with the next marker.
+"""
+import queue
+import threading
+
+from psychopy import core
+
+logHeader = 'code,label,requestT,flipT,writeStartT,writeEndT\n'
+
+
+class MarkerDispatcher:
+
+    def __init__(self, ser, win, telemetry=None):
+        self.ser = ser
+        self.win = win
+        self.telemetry = telemetry
+        self.log = []   # one (code, label, requestT, flipT, writeStartT, writeEndT) tuple per marker
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='MarkerDispatcher', daemon=True)
+        self.thread.start()
+
+    def send(self, code, label=''):
+        # write the marker as soon as possible
+        self.queue.put((code, label, core.getTime(), float('nan')))
+
+    def sendOnFlip(self, code, label=''):
+        # write the marker right after the next win.flip()
+        self.win.callOnFlip(self._flipped, code, label, core.getTime())
+
+    def _flipped(self, code, label, requestT):
+        self.queue.put((code, label, requestT, core.getTime()))
+
+    def drain(self):
+        # wait until all queued markers are written
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def saveLog(self, path):
+        with open(path, 'w', encoding='utf8') as logFile:
+            logFile.write(logHeader)
+            for entry in self.log:
+                logFile.write('%s,%s,%.6f,%.6f,%.6f,%.6f\n' % entry)
+
+    # I/O thread
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                code, label, requestT, flipT = item
+                writeStartT = core.getTime()
+                try:
+                    self.ser.write(str(code).encode())
+                except Exception as error:     # serial.SerialException, OSError, ...
+                    print('Marker %s (%s) not written: %r' % (code, label, error))
+                    self.log.append((code, label, requestT, flipT, writeStartT, float('nan')))
+                    continue
+                self.log.append((code, label, requestT, flipT, writeStartT, core.getTime()))
+                if self.telemetry is not None:
+                    self.telemetry.publish('marker', code=str(code), label=label)
+            finally:
+                self.queue.task_done()     # drain() never waits for a marker that failed
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration log (_CAL.csv): one row per delivered stimulus.
+
+    series,step,intensity,VAS,timestamp,session
+    start,1,1,,12.301002,0      <- first intensity of series 1 (lower ones skipped)
+    1,1,1,,12.345678,0          <- not felt: no rating
+    1,2,4,3,20.411062,0
+    ...
+    estimate,40,9.513,40,1302.5,0        <- intensity for VAS 40 from curveFit()
+    ci95,40,8.912,10.204,1302.5,0        <- its 95% bootstrap interval (lower, upper)
+
+session is 0 for the rows of the first session and n for the rows written
+after the n-th resume (checkpoint.py); the timestamps (core.getTime()) start
+again at 0 in every session. Files without the session column are read
+the same way.
+
+Files written before this format repeated the whole intensity and rating
+lists of the series on every step (the file grows quadratically) and ended
+with a total line and free-text estimates. readCalibration() reads both
+formats in one streaming pass; for legacy files only the last line of each
+series and the total line are parsed.
+"""
+import re
+
+calHeader = 'series,step,intensity,VAS,timestamp,session\n'
+calHeaders = (calHeader, 'series,step,intensity,VAS,timestamp\n')     # current and before the session column
+
+def stepRow(series, step, intensity, VAS, timestamp, session=0):
+    # VAS = None for a stimulus that was not felt
+    return '%i,%i,%s,%s,%.6f,%i\n' % (series, step, intensity, '' if VAS is None else VAS, timestamp, session)
+
+def startRow(series, intensity, timestamp, session=0):
+    # intensities below the start of the series were skipped (calibration prior, calprior.py)
+    return 'start,%i,%i,,%.6f,%i\n' % (series, intensity, timestamp, session)
+
+def estimateRow(target, intensity, timestamp, session=0):
+    return 'estimate,%i,%f,%i,%.6f,%i\n' % (target, intensity, target, timestamp, session)
+
+def intervalRow(target, lower, upper, level, timestamp, session=0):
+    return 'ci%i,%i,%f,%f,%.6f,%i\n' % (round(level * 100), target, lower, upper, timestamp, session)
+
+###############################################################################
+# %% Reading
+###############################################################################
+
+listPattern = re.compile(r'\[([^\]]*)\]')
+numpyScalar = re.compile(r'np\.\w+\(([^)]*)\)')    # np.int64(5) in lists printed with numpy >= 2
+legacyEstimate = re.compile(r'Estimation for (\d+) on VAS: (\S+)')
+
+def parseList(text):
+    return [float(v) for v in numpyScalar.sub(r'\1', text).split(',') if v.strip()]
+
+def readCalibration(path):
+    # rated intensities, their ratings and the estimates {VAS target: intensity}
+    with open(path, encoding='utf8') as calFile:
+        header = calFile.readline()
+        if header in calHeaders:
+            return _readRows(calFile)
+        return _readLegacy(calFile)
+
+def readStart(path):
+    # first intensity of the first series; 1 for files without start rows (all legacy files)
+    with open(path, encoding='utf8') as calFile:
+        for line in calFile:
+            if line.startswith('start,'):
+                return int(line.split(',')[2])
+    return 1
+
+def readIntervals(path):
+    # bootstrap intervals {VAS target: (lower, upper)}; empty for files without them
+    intervals = {}
+    with open(path, encoding='utf8') as calFile:
+        for line in calFile:
+            fields = line.rstrip('\n').split(',')
+            if len(fields) >= 5 and fields[0].startswith('ci'):
+                intervals[int(fields[1])] = (float(fields[2]), float(fields[3]))
+    return intervals
+
+def readRows(path):
+    # fields of every complete row after the header (current format)
+    with open(path, encoding='utf8') as calFile:
+        calFile.readline()
+        return [fields for fields in (line.rstrip('\n').split(',') for line in calFile) if len(fields) == 6]
+
+def _readRows(calFile):
+    x, y, estimates = [], [], {}
+    for line in calFile:
+        fields = line.rstrip('\n').split(',')
+        if len(fields) not in (5, 6):
+            continue    # torn last line
+        if fields[0] == 'estimate':
+            estimates[int(fields[1])] = float(fields[2])
+        elif fields[3] and fields[0].isdigit():    # rated step
+            x.append(float(fields[2]))
+            y.append(float(fields[3]))
+    return x, y, estimates
+
+def _readLegacy(calFile):
+    # every series line repeats the previous one with one value appended, so
+    # only the last line of each series is kept (unparsed until the end)
+    total = None
+    lastLines = []
+    previous = None     # intensity list of the previous series line, without ']'
+    estimates = {}
+    for line in calFile:
+        if line.startswith('['):
+            if total is not None:
+                continue
+            intensities = line[:line.find(']')]
+            if previous is not None and intensities.startswith(previous + ','):
+                lastLines[-1] = line
+            else:
+                lastLines.append(line)
+            previous = intensities
+        elif line.startswith('Estimation'):
+            match = legacyEstimate.match(line)
+            if match:
+                estimates[int(match.group(1))] = float(match.group(2))
+        elif '[' in line and total is None:     # group,[all intensities],[all ratings] from curveFit()
+            total = line
+
+    x, y = [], []
+    for line in [total] if total is not None else lastLines:
+        lists = listPattern.findall(line)
+        if len(lists) == 2:
+            x += parseList(lists[0])
+            y += parseList(lists[1])
+    return x, y, estimates
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration prior: fitted curves and detection thresholds of past participants.
+
+Every participant's exponential fit (a, b) and detection threshold (the
+lowest intensity rated in calibration) is kept in a local SQLite database,
+indexed by threshold. safeStart() looks up a low quantile of the thresholds
+(one indexed query) and returns a start intensity below it, so calibration
+does not spend its first steps on intensities nearly nobody feels. With too
+few participants in the store the start stays at 1, as before.
+
+A participant who felt the first stimulus has a threshold at or below the
+start intensity; 'start' is stored so these rows can be told apart.
+
+Run this file to fill the store from existing _CAL.csv files:
+    python calprior.py [data directory] [database]
+"""
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from callog import readCalibration, readStart
+from expfit import fitBatch
+
+schema = '''
+CREATE TABLE IF NOT EXISTS calibrations (
+    source TEXT PRIMARY KEY,    -- _CAL.csv file name
+    subID TEXT,
+    grp TEXT,
+    saved TEXT,
+    a REAL,
+    b REAL,
+    threshold REAL,     -- lowest rated intensity (1 = 0.1 mA)
+    start INTEGER       -- first intensity of the calibration series
+);
+CREATE INDEX IF NOT EXISTS calibrationsThreshold ON calibrations (threshold);
+'''
+
+
+class CalibrationPrior:
+
+    def __init__(self, path=':memory:', quantile=0.05, margin=0.5, minParticipants=20):
+        self.quantile = quantile    # start below this quantile of the thresholds
+        self.margin = margin        # start = margin * threshold quantile
+        self.minParticipants = minParticipants
+        self.db = sqlite3.connect(path)
+        self.db.executescript(schema)
+
+    def add(self, source, subID, group, a, b, threshold, start=1):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO calibrations VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (source, subID, group, time.strftime('%Y-%m-%d %H:%M:%S'), _real(a), _real(b),
+                             _real(threshold), int(start)))
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM calibrations WHERE threshold IS NOT NULL').fetchone()[0]
+
+    def thresholdQuantile(self, q):
+        # q-quantile of the stored thresholds (lower value, no interpolation); None if the store is empty
+        n = self.count()
+        if n == 0:
+            return None
+        return self.db.execute('SELECT threshold FROM calibrations WHERE threshold IS NOT NULL '
+                               'ORDER BY threshold LIMIT 1 OFFSET ?', (int(q * (n - 1)),)).fetchone()[0]
+
+    def safeStart(self, ceiling=149):
+        # (start intensity, participants in the prior); 1 until the store has minParticipants
+        n = self.count()
+        if n < self.minParticipants:
+            return 1, n
+        return int(min(max(1, self.margin * self.thresholdQuantile(self.quantile)), ceiling)), n
+
+    def close(self):
+        self.db.close()
+
+
+def _real(value):
+    # numpy scalars and NaN as SQLite REAL / NULL
+    return None if value is None or np.isnan(value) else float(value)
+
+###############################################################################
+# %% Import of existing calibration files
+###############################################################################
+
+def importDirectory(dataDir, prior):
+    # add every _CAL.csv in dataDir (file name: subID_group_..._CAL.csv)
+    paths = sorted(glob.glob(os.path.join(dataDir, '*_CAL.csv')))
+    data = [readCalibration(path)[:2] for path in paths]
+    a, b = fitBatch([x for x, y in data], [y for x, y in data])
+    for path, (x, y), ai, bi in zip(paths, data, a, b):
+        subID, group = os.path.basename(path).split('_')[:2]
+        prior.add(os.path.basename(path), subID, group, ai, bi, min(x) if x else np.nan, readStart(path))
+    return len(paths)
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    dataDir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'K5_data')
+    prior = CalibrationPrior(sys.argv[2] if len(sys.argv) > 2 else os.path.join(here, 'calPrior.sqlite'))
+    print('Imported %i calibration files' % importDirectory(dataDir, prior))
+    start, n = prior.safeStart()
+    print('%i participants in the prior, start intensity %i' % (n, start))
+    prior.close()
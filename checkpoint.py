@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Participant checkpoints for resuming an interrupted session.
+
+The state a participant's session needs to continue (calibration steps and
+estimates, baseline ratings, completed phases, trials done in the current
+phase, schedule seed and file stem) is encoded as JSON after every trial
+and phase. encode() is the only part on the experiment thread; the file is
+replaced by the trial writer thread (TrialWriter.replace(): write, fsync,
+rename), after the rows of the same trial, so a checkpoint never counts a
+trial whose rows are neither in the data files nor in the journal. After a
+hard crash (power loss, killed process) the last checkpoint may still be in
+the queue while the rows of the trial are already in the journal (the rows
+of a trial are journaled as one record, TrialWriter.writeRows()). The
+checkpoint counts the rows of the trial and calibration files, so rows
+found after that count on resuming (Session.recoverTrials()) are complete
+trials: they are counted as done instead of being run again.
+
+Resuming restores this state and runParticipant() skips the completed
+phases and the completed trials of the current one. The color order comes
+from the saved seed, so the remaining trials are the ones that were
+scheduled.
+"""
+import json
+import os
+
+checkpointVersion = 2
+
+# Session attributes saved in a checkpoint
+stateFields = ('subID', 'group', 'expDate', 'seed', 'calStart', 'calSeries', 'calSteps', 'calThresholds',
+               'stimIntTotal', 'stimVASTotal', 'estimationVAS40', 'estimationVAS50', 'estimationVAS60',
+               'estimationVAS', 'baselineRatings', 'baselineMean', 'completed', 'phase', 'trialsDone',
+               'resumes', 'finished', 'trialRows', 'calRows')
+
+
+def checkpointPath(dataDir, subID):
+    return os.path.join(dataDir, '%s_CHECKPOINT.json' % subID)
+
+def encode(session):
+    state = {field: getattr(session, field) for field in stateFields}
+    state['version'] = checkpointVersion
+    return json.dumps(state, default=float)     # numpy scalars from the fit
+
+def load(path):
+    # saved state, or None if there is no checkpoint to resume (missing, finished or older version)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf8') as checkpointFile:
+        state = json.load(checkpointFile)
+    if state.get('version') != checkpointVersion or state['finished']:
+        return None
+    return state
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Background writer for the trial data files.
+
+The trial loops only put rows on a queue; a writer thread appends them to
+the data files and flushes them according to the flush policy. Every row
+is first appended (and fsynced) to a journal on the local disk, so rows
+that were not yet flushed to the data files can be recovered with
+recoverJournals() after a crash. Rows are text, or bytes for binary files
+(trialstore.py); binary rows are journaled base64-encoded. writeRows()
+journals the rows of one trial as a single record, so a crash recovers all
+of them or none. replace() atomically replaces a whole file (checkpoint.py)
+in order with the rows.
+
+If writing a data file fails (e.g. the share is gone), the writer thread
+stops writing the data files but keeps journaling every row, and the
+journal is kept at close(); the rows are recovered by the next session. The
+error is raised once, by the next write(), sync(), replace() or close().
+recoverJournals() skips the journals of processes that are still running.
+"""
+import atexit
+import base64
+import ctypes
+import glob
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+# Sync levels in increasing order; a data file is flushed when the level
+# passed to sync() is at least the flush policy
+syncLevels = {'trial': 0, 'block': 1, 'pause': 2}
+
+defaultJournalDir = os.path.join(tempfile.gettempdir(), 'K5_journal')
+
+
+class TrialWriter:
+    """Appends rows to data files from a background thread."""
+
+    def __init__(self, flushPolicy='trial', journalDir=defaultJournalDir):
+        if flushPolicy not in syncLevels:
+            raise ValueError('flushPolicy must be one of %s' % list(syncLevels))
+        self.flushPolicy = flushPolicy
+        os.makedirs(journalDir, exist_ok=True)
+        self.journalPath = os.path.join(journalDir, 'journal_%i_%i.log' % (os.getpid(), time.time()))
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name='TrialWriter', daemon=True)
+        self.closed = False
+        self.error = None       # first error of the writer thread
+        self.reported = False
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Called from the experiment thread; each call is a single enqueue
+    # row = str for text files, bytes for binary files
+    def write(self, path, row):
+        self.queue.put(('rows', [(path, row)]))
+        self.raiseError()
+
+    def writeRows(self, rows):
+        # (path, row) pairs of one trial, journaled together
+        self.queue.put(('rows', list(rows)))
+        self.raiseError()
+
+    def sync(self, level):
+        self.queue.put(('sync', syncLevels[level]))
+        self.raiseError()
+
+    def replace(self, path, text):
+        # write text to path.tmp, fsync and rename over path, after the rows queued before
+        self.queue.put(('replace', path, text))
+        self.raiseError()
+
+    def close(self):
+        # flush everything, stop the thread and drop the journal (kept after an error)
+        if not self.closed:
+            self.closed = True
+            self.queue.put(('stop', None))
+            self.thread.join()
+        self.raiseError()
+
+    def raiseError(self):
+        # a failure of the writer thread, raised once
+        if self.error is not None and not self.reported:
+            self.reported = True
+            raise OSError('Writing the data files failed (%r); rows are kept in %s and recovered by the next session'
+                          % (self.error, self.journalPath)) from self.error
+
+    # Writer thread
+    def _run(self):
+        policy = syncLevels[self.flushPolicy]
+        files = {}      # open data files by path
+        seq = 0         # number of the last journaled row
+        journal = open(self.journalPath, 'a', encoding='utf8')
+        failed = False  # after a data file error only the journal is written, without commits
+
+        def flushAll():
+            for dataFile in files.values():
+                dataFile.flush()
+                os.fsync(dataFile.fileno())
+            journal.write(json.dumps(['commit', seq]) + '\n')
+            journal.flush()
+
+        def fail(error):
+            nonlocal failed
+            failed = True
+            if self.error is None:
+                self.error = error
+
+        while True:
+            kind, *args = self.queue.get()
+            try:
+                if kind == 'rows':
+                    rows = args[0]
+                    seq += 1
+                    journal.write(json.dumps(['rows', seq, [journalRow(path, row) for path, row in rows]]) + '\n')
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                    if failed:
+                        continue
+                    for path, row in rows:
+                        if path not in files:
+                            files[path] = open(path, 'ab') if isinstance(row, bytes) else open(path, 'a', encoding='utf8')
+                        files[path].write(row)
+                    if policy == syncLevels['trial']:
+                        flushAll()
+                elif kind == 'sync':
+                    if args[0] >= policy and not failed:
+                        flushAll()
+                elif kind == 'replace':
+                    path, text = args
+                    with open(path + '.tmp', 'w', encoding='utf8') as tmpFile:
+                        tmpFile.write(text)
+                        tmpFile.flush()
+                        os.fsync(tmpFile.fileno())
+                    os.replace(path + '.tmp', path)
+                elif kind == 'stop':
+                    if not failed:
+                        flushAll()
+                    break
+            except OSError as error:
+                fail(error)
+                if kind == 'stop':
+                    break
+
+        for dataFile in files.values():
+            try:
+                dataFile.close()
+            except OSError as error:
+                fail(error)
+        journal.close()
+        if not failed:
+            os.remove(self.journalPath)
+
+###############################################################################
+# %% Crash recovery
+###############################################################################
+
+def journalRow(path, row):
+    # [path, row] for text rows, [path, base64, 'base64'] for binary rows
+    if isinstance(row, bytes):
+        return [path, base64.b64encode(row).decode('ascii'), 'base64']
+    return [path, row]
+
+def processRunning(pid):
+    # True if a process with this ID is running (a reused ID counts as running)
+    if pid == os.getpid():
+        return True
+    if sys.platform == 'win32':
+        # os.kill() would terminate the process on Windows
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)    # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exitCode = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exitCode))
+        kernel32.CloseHandle(handle)
+        return exitCode.value == 259    # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recoverJournals(journalDir=defaultJournalDir):
+    # append rows left uncommitted by a crashed or failed session to their data
+    # files; journals of running processes are left alone. Returns the number of rows recovered
+    recovered = 0
+    for journalPath in sorted(glob.glob(os.path.join(journalDir, 'journal_*.log'))):
+        if processRunning(int(os.path.basename(journalPath).split('_')[1])):
+            continue
+        pending = {}    # uncommitted rows by data file
+        with open(journalPath, encoding='utf8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break   # torn last line
+                if record[0] == 'commit':
+                    pending.clear()
+                    continue
+                # ['rows', seq, [journal rows]] or, from older journals, ['row', seq, path, row(, 'base64')]
+                for entry in record[2] if record[0] == 'rows' else [record[2:]]:
+                    if len(entry) > 2:  # binary row
+                        pending.setdefault(entry[0], []).append(base64.b64decode(entry[1]))
+                    else:
+                        pending.setdefault(entry[0], []).append(entry[1])
+
+        for path, rows in pending.items():
+            # rows may have reached the data file before the crash; skip
+            # the longest run of pending rows already at the end of the file
+            binary = isinstance(rows[0], bytes)
+            empty = b'' if binary else ''
+            tail = empty
+            if os.path.exists(path):
+                with open(path, 'rb') if binary else open(path, encoding='utf8') as dataFile:
+                    tail = dataFile.read()
+            done = next(k for k in range(len(rows), -1, -1) if tail.endswith(empty.join(rows[:k])))
+            with open(path, 'ab') if binary else open(path, 'a', encoding='utf8') as dataFile:
+                dataFile.write(empty.join(rows[done:]))
+                dataFile.flush()
+                os.fsync(dataFile.fileno())
+            recovered += len(rows) - done
+        os.remove(journalPath)
+    return recovered
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Event-locked EDA epochs from Biopac recordings, joined with the trial CSV.
+
+A recording is a binary export of interleaved channels (float32 by default)
+or a .npy array (samples x channels); both are memory-mapped, so only the
+pages around the events are read. AcqKnowledge text exports are converted
+to the binary format once (convertText()).
+
+The marker channel holds the code written to the serial port (biopacmarkers.py)
+as a number, 0 for '00'. decodeMarkers() finds every change to a new
+nonzero code in chunks, and decodeEvents() maps the color onset codes back to
+block type and color (protocol.py): baseMarker, baseExpectMarker and
+colorsOnly/expectation/painMarker + colorMarker. Epochs are windows of a
+sliding_window_view over the EDA channel, gathered at the onsets and
+baseline-corrected with the mean of the pre-onset part. The n-th onset of a
+code is joined with the n-th trial row with that marker, so repeated
+baseline blocks stay in order.
+
+Every participant runs in a process pool. Per participant the epochs are
+saved as <recording>_EPOCHS.npy (one row per trial, NaN where the
+recording has no onset); all trials go to K5_epochs.csv with the peak and
+mean of the baseline-corrected response.
+
+    python epoching.py [recordings directory] [data directory] [--rate HZ] [--channels N]
+                       [--eda CH] [--marker CH] [--pre S] [--post S] [--dtype DTYPE] [--workers N]
+
+Recording files are matched with the trial CSV by the participant ID before
+the first '_' of the file name.
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from protocol import (colorTrials, baselineTrials, baseMarker, baseExpectMarker, colorsOnlyMarker,
+                      expectationMarker, painMarker)
+from trialstore import isTrialCSV, readTrialCSV
+
+recordingExtensions = ('.npy', '.bin', '.raw', '.dat')
+
+eventDtype = np.dtype([
+    ('sample', 'i8'),
+    ('code', 'i2'),
+    ('blockType', 'U20'),
+    ('bcgColor', 'U8'),
+    ('occurrence', 'i4'),   # n-th onset of this code in the recording, from 0
+])
+
+epochColumns = ['subID', 'group', 'blockType', 'blockCounter', 'bcgColor', 'marker', 'VAS',
+                'onsetT', 'peak', 'mean']
+
+###############################################################################
+# %% Recordings
+###############################################################################
+
+def openRecording(path, nChannels=2, dtype='<f4'):
+    # read-only memory map, samples x channels
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=dtype, mode='r').reshape(-1, nChannels)
+
+def convertText(txtPath, outPath, headerLines=0, chunkRows=1000000, dtype='<f4'):
+    # text export (one row per sample, one column per channel) -> interleaved binary, in chunks
+    with open(txtPath, encoding='utf8') as txtFile, open(outPath, 'wb') as outFile:
+        for i in range(headerLines):
+            next(txtFile)
+        while True:
+            chunk = np.loadtxt(txtFile, delimiter=None, max_rows=chunkRows, ndmin=2)
+            if not len(chunk):
+                break
+            outFile.write(chunk.astype(dtype).tobytes())
+    return outPath
+
+###############################################################################
+# %% Markers and events
+###############################################################################
+
+def onsetCodes():
+    # marker code -> (blockType, bcgColor) of every color onset
+    codes = {int(baseMarker): ('baseline', baselineTrials[0]['colorName']),
+             int(baseExpectMarker): ('baselineExpectation', baselineTrials[0]['colorName'])}
+    for base, blockType in ((colorsOnlyMarker, 'colors'), (expectationMarker, 'expectation'), (painMarker, 'intensity')):
+        for color in colorTrials:
+            codes[base + color['colorMarker']] = (blockType, color['colorName'])
+    return codes
+
+def decodeMarkers(markerChannel, chunk=2**22):
+    # (sample, code) of every change to a nonzero code
+    samples, codes = [], []
+    previous = 0
+    for start in range(0, len(markerChannel), chunk):
+        values = np.rint(markerChannel[start:start + chunk]).astype(np.int16)
+        changed = np.flatnonzero(np.diff(values, prepend=previous) != 0)
+        changed = changed[values[changed] != 0]
+        samples.append(changed + start)
+        codes.append(values[changed])
+        previous = values[-1]
+    return np.concatenate(samples), np.concatenate(codes)
+
+def occurrences(keys):
+    # n-th occurrence of every key, in order (vectorized group-wise counter)
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sortedKeys[1:] != sortedKeys[:-1]])
+    runStarts = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    counts = np.empty(len(keys), dtype=np.int64)
+    counts[order] = np.arange(len(keys)) - runStarts
+    return counts
+
+def decodeEvents(markerChannel):
+    # color onsets of the recording as eventDtype records
+    samples, codes = decodeMarkers(markerChannel)
+    table = onsetCodes()
+    isOnset = np.isin(codes, list(table))
+    samples, codes = samples[isOnset], codes[isOnset]
+    events = np.empty(len(codes), dtype=eventDtype)
+    events['sample'] = samples
+    events['code'] = codes
+    names = np.array([table[code] for code in sorted(table)])
+    index = np.searchsorted(sorted(table), codes)
+    events['blockType'] = names[index, 0]
+    events['bcgColor'] = names[index, 1]
+    events['occurrence'] = occurrences(codes)
+    return events
+
+###############################################################################
+# %% Epochs
+###############################################################################
+
+def extractEpochs(signal, onsets, pre, post):
+    # baseline-corrected windows [onset - pre, onset + post) in samples; NaN rows where the window does not fit
+    epochs = np.full((len(onsets), pre + post), np.nan, dtype=np.float32)
+    valid = (onsets >= pre) & (onsets + post <= len(signal))
+    if np.any(valid):
+        windows = sliding_window_view(signal, pre + post)    # view, nothing copied
+        epochs[valid] = windows[onsets[valid] - pre]     # reads only the epochs
+        epochs[valid] -= epochs[valid, :pre].mean(1, keepdims=True)
+    return epochs
+
+def joinTrials(trials, events):
+    # index into events for every trial (-1 = no onset in the recording), by marker and occurrence
+    trialKeys = trials['marker'].astype(np.int64) * 100000 + occurrences(trials['marker'])
+    eventKeys = events['code'].astype(np.int64) * 100000 + events['occurrence']
+    index = np.full(len(trials), -1)
+    common, trialIndex, eventIndex = np.intersect1d(trialKeys, eventKeys, return_indices=True)
+    index[trialIndex] = eventIndex
+    return index
+
+def epochParticipant(job):
+    # worker: epochs of one recording joined with its trial CSV; returns the rows of K5_epochs.csv
+    recordingPath, csvPath, outDir, options = job
+    recording = openRecording(recordingPath, options['channels'], options['dtype'])
+    rate = options['rate']
+    pre, post = int(round(options['pre'] * rate)), int(round(options['post'] * rate))
+    events = decodeEvents(recording[:, options['marker']])
+    trials = readTrialCSV(csvPath)
+    index = joinTrials(trials, events)
+
+    onsets = np.full(len(trials), -1, dtype=np.int64)     # -1: no window, NaN epoch
+    onsets[index >= 0] = events['sample'][index[index >= 0]]
+    epochs = extractEpochs(recording[:, options['eda']], onsets, pre, post)
+    stem = os.path.splitext(os.path.basename(recordingPath))[0]
+    np.save(os.path.join(outDir, stem + '_EPOCHS.npy'), epochs)
+
+    response = epochs[:, pre:]      # NaN rows stay NaN
+    peak, mean = response.max(1), response.mean(1)
+    onsetT = np.where(index >= 0, onsets / rate, np.nan)
+    return [tuple(trial.tolist()) + (t, p, m) for trial, t, p, m in zip(trials, onsetT, peak, mean)]
+
+###############################################################################
+# %% Cohort
+###############################################################################
+
+def pairRecordings(recordingDir, dataDir):
+    # (recording, trial CSV) of every participant with both, matched by participant ID
+    csvPaths = {os.path.basename(path).split('_')[0]: path for path in glob.glob(os.path.join(dataDir, '*.csv'))
+                if isTrialCSV(path)}
+    pairs = []
+    for path in sorted(glob.glob(os.path.join(recordingDir, '*'))):
+        subID = os.path.basename(path).split('_')[0]
+        if path.endswith(recordingExtensions) and not path.endswith('_EPOCHS.npy') and subID in csvPaths:
+            pairs.append((path, csvPaths[subID]))
+    return pairs
+
+def epochDirectory(recordingDir, dataDir, outDir=None, workers=None, **options):
+    outDir = outDir or dataDir
+    os.makedirs(outDir, exist_ok=True)
+    jobs = [(recordingPath, csvPath, outDir, options) for recordingPath, csvPath in pairRecordings(recordingDir, dataDir)]
+    outPath = os.path.join(outDir, 'K5_epochs.csv')
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(outPath, 'w', encoding='utf8') as outFile:
+        outFile.write(','.join(epochColumns) + '\n')
+        for rows in pool.map(epochParticipant, jobs):
+            for row in rows:
+                outFile.write(','.join('' if isinstance(v, float) and np.isnan(v) else str(v) for v in row) + '\n')
+    print('%i recordings epoched' % len(jobs))
+    return outPath
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recordingDir', nargs='?', default=os.path.join(here, 'K5_biopac'))
+    parser.add_argument('dataDir', nargs='?', default=os.path.join(here, 'K5_data'))
+    parser.add_argument('--out', default=None, help='output folder (default: the data folder)')
+    parser.add_argument('--rate', type=float, default=1000, help='sampling rate in Hz')
+    parser.add_argument('--channels', type=int, default=2, help='channels in binary recordings')
+    parser.add_argument('--eda', type=int, default=0, help='EDA channel')
+    parser.add_argument('--marker', type=int, default=1, help='marker channel')
+    parser.add_argument('--pre', type=float, default=1.0, help='baseline before the onset in s')
+    parser.add_argument('--post', type=float, default=6.0, help='epoch after the onset in s')
+    parser.add_argument('--dtype', default='<f4', help='sample type of binary recordings')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    print('Saved', epochDirectory(args.recordingDir, args.dataDir, args.out, args.workers, rate=args.rate,
+                                  channels=args.channels, eda=args.eda, marker=args.marker, pre=args.pre,
+                                  post=args.post, dtype=args.dtype))
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Exponential fit of the calibration ratings, VAS = a * exp(b * x).
+
+The fit is seeded with a log-linear least-squares solution (positive ratings
+only), then refined by curve_fit with an analytic Jacobian and bounds.
+inverseExponential() gives the intensity for any VAS target.
+
+fitBatch() fits many participants at once with a vectorized
+Levenberg-Marquardt on padded arrays. bootstrapIntervals() uses the same
+solver to refit hundreds of resampled calibrations at once, for confidence
+intervals of the estimated intensities during the session. Run this file to
+refit every _CAL.csv in K5_data:
+    python expfit.py [data directory]
+"""
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from callog import readCalibration
+
+# Bounds for a and b; b > 0 keeps the curve increasing so it can be inverted
+lowerBounds = (1e-6, 1e-4)
+upperBounds = (1e3, 1.0)
+
+targets = (40, 50, 60)     # VAS targets reported by the batch refit
+
+def exponential(x, a, b):
+    return a * np.exp(b * x)
+
+def exponentialJacobian(x, a, b):
+    e = np.exp(b * x)
+    return np.column_stack((e, a * x * e))
+
+def inverseExponential(vas, a, b):
+    # intensity at which the fitted curve reaches vas (scalar or array)
+    return np.log(np.asarray(vas, dtype=float) / a) / b
+
+def seedExponential(x, y):
+    # closed-form start values from a straight line through (x, log y)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    positive = y > 0
+    if positive.sum() >= 2 and np.ptp(x[positive]) > 0:
+        b, logA = np.polyfit(x[positive], np.log(y[positive]), 1)
+    else:
+        b, logA = 0.05, np.log(max(y.mean(), 1)) - 0.05 * x.mean()
+    return (float(np.clip(np.exp(logA), lowerBounds[0], upperBounds[0])),
+            float(np.clip(b, lowerBounds[1], upperBounds[1])))
+
+def fitExponential(x, y):
+    # returns (a, b)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    popt, pcov = curve_fit(exponential, x, y, p0=seedExponential(x, y), jac=exponentialJacobian,
+                           bounds=(lowerBounds, upperBounds), method='trf')
+    return popt[0], popt[1]
+
+###############################################################################
+# %% Vectorized batch fit
+###############################################################################
+
+def fitBatch(xs, ys, iterations=100):
+    # fit a list of (x, y) series at once; returns arrays a, b (nan if < 2 points)
+    nSeries = len(xs)
+    length = max((len(x) for x in xs), default=0)
+    x = np.zeros((nSeries, length))
+    y = np.zeros((nSeries, length))
+    mask = np.zeros((nSeries, length), dtype=bool)
+    for i, (xi, yi) in enumerate(zip(xs, ys)):
+        x[i, :len(xi)] = xi
+        y[i, :len(yi)] = yi
+        mask[i, :len(xi)] = True
+    return fitPadded(x, y, mask, iterations)
+
+def fitPadded(x, y, mask, iterations=100, start=None):
+    # fitBatch() on padded arrays (series x points, mask = real points); start = (a, b) seeds, default log-linear
+    nSeries = len(x)
+    if start is not None:
+        a, b = (np.broadcast_to(np.asarray(v, dtype=float), nSeries).copy() for v in start)
+        return _levenbergMarquardt(x, y, mask, a, b, iterations)
+
+    # log-linear seeds for all series at once
+    positive = mask & (y > 0)
+    n = positive.sum(1)
+    logY = np.log(np.where(positive, y, 1))
+    sx = (x * positive).sum(1)
+    sy = (logY * positive).sum(1)
+    sxx = (x * x * positive).sum(1)
+    sxy = (x * logY * positive).sum(1)
+    denom = n * sxx - sx ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = np.where(denom > 0, (n * sxy - sx * sy) / denom, 0.05)
+        logA = np.where(n > 0, (sy - b * sx) / n, 0.0)
+    a = np.clip(np.exp(logA), lowerBounds[0], upperBounds[0])
+    b = np.clip(b, lowerBounds[1], upperBounds[1])
+    return _levenbergMarquardt(x, y, mask, a, b, iterations)
+
+def _levenbergMarquardt(x, y, mask, a, b, iterations):
+    nSeries = len(x)
+
+    def sse(a, b):
+        r = (a[:, None] * np.exp(b[:, None] * x) - y) * mask
+        return (r ** 2).sum(1)
+
+    # Levenberg-Marquardt with a damping factor per series
+    lam = np.full(nSeries, 1e-3)
+    cost = sse(a, b)
+    for iteration in range(iterations):
+        e = np.exp(b[:, None] * x) * mask
+        r = a[:, None] * e - y * mask
+        ja = e
+        jb = a[:, None] * x * e
+        jaa, jab, jbb = (ja * ja).sum(1), (ja * jb).sum(1), (jb * jb).sum(1)
+        ga, gb = (ja * r).sum(1), (jb * r).sum(1)
+        haa, hbb = jaa * (1 + lam), jbb * (1 + lam)
+        det = haa * hbb - jab ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            da = np.where(det > 0, -(hbb * ga - jab * gb) / det, 0)
+            db = np.where(det > 0, -(haa * gb - jab * ga) / det, 0)
+        newA = np.clip(a + da, lowerBounds[0], upperBounds[0])
+        newB = np.clip(b + db, lowerBounds[1], upperBounds[1])
+        newCost = sse(newA, newB)
+        better = newCost < cost
+        a = np.where(better, newA, a)
+        b = np.where(better, newB, b)
+        cost = np.where(better, newCost, cost)
+        lam = np.where(better, lam / 3, lam * 3)
+
+    valid = mask.sum(1) >= 2
+    return np.where(valid, a, np.nan), np.where(valid, b, np.nan)
+
+###############################################################################
+# %% Bootstrap confidence intervals
+###############################################################################
+
+def bootstrapIntervals(x, y, a, b, vas=targets, level=0.95, nBoot=1000, budget=0.2, chunk=250, iterations=30, seed=None):
+    # percentile intervals of the intensities for vas: the (x, y) pairs are
+    # resampled with replacement and every resample is refit, seeded with
+    # the fit (a, b). Resamples are fitted chunk by chunk until nBoot or the
+    # time budget in s is used up. Returns lower, upper (one per target) and
+    # the number of resamples used
+    started = time.perf_counter()
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rng = np.random.default_rng(seed)
+    vas = np.asarray(vas, dtype=float)
+    estimates = []
+    done = 0
+    while done < nBoot and (done == 0 or time.perf_counter() - started < budget):
+        size = min(chunk, nBoot - done)
+        index = rng.integers(0, len(x), (size, len(x)))
+        xs, ys = x[index], y[index]
+        aBoot, bBoot = fitPadded(xs, ys, np.ones(xs.shape, dtype=bool), iterations, start=(a, b))
+        aBoot[np.ptp(xs, axis=1) == 0] = np.nan    # all points at one intensity: no curve
+        estimates.append(inverseExponential(vas[None, :], aBoot[:, None], bBoot[:, None]))
+        done += size
+    estimates = np.concatenate(estimates)
+    tail = (1 - level) / 2 * 100
+    lower, upper = np.nanpercentile(estimates, [tail, 100 - tail], axis=0)
+    return lower, upper, done
+
+###############################################################################
+# %% Refit of the calibration files
+###############################################################################
+
+def readCalibrationFile(path):
+    # intensities and ratings from a _CAL.csv file, either format (see callog.py)
+    x, y, estimates = readCalibration(path)
+    return x, y
+
+def refitDirectory(dataDir, outPath=None):
+    paths = sorted(glob.glob(os.path.join(dataDir, '*_CAL.csv')))
+    data = [readCalibrationFile(path) for path in paths]
+    a, b = fitBatch([d[0] for d in data], [d[1] for d in data])
+    estimates = inverseExponential(np.array(targets)[None, :], a[:, None], b[:, None])
+
+    outPath = outPath or os.path.join(dataDir, 'calibration_refit.csv')
+    with open(outPath, 'w', encoding='utf8') as outFile:
+        outFile.write('file,points,a,b,%s\n' % ','.join('VAS%i' % t for t in targets))
+        for path, d, ai, bi, est in zip(paths, data, a, b, estimates):
+            outFile.write('%s,%i,%f,%f,%s\n' % (os.path.basename(path), len(d[0]), ai, bi, ','.join('%f' % e for e in est)))
+    return outPath
+
+
+if __name__ == '__main__':
+    dataDir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'K5_data')
+    print('Saved', refitDirectory(dataDir))
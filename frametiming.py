@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Per-frame timing recorder.
+
+Flip timestamps of the current trial are stored in a preallocated array, so
+recording a frame is a single array assignment. At the end of a trial the
+intervals are compared with the measured frame rate and a per-trial summary
+is kept; saveReport() writes the trials and a per-block summary at the end
+of the session.
+"""
+import numpy as np
+
+dropFactor = 1.5    # an interval longer than 1.5 frames means at least one dropped frame
+onsetFrames = 10    # number of intervals after the onset checked for drops
+
+trialHeader = 'blockType,blockCounter,label,frames,droppedFrames,onsetDroppedFrames,meanInterval,maxInterval,overflow\n'
+blockHeader = 'blockType,blockCounter,trials,frames,droppedFrames,trialsWithDrops,trialsWithOnsetDrops,maxInterval\n'
+
+
+class FrameRecorder:
+
+    def __init__(self, frate, maxSeconds=120):
+        self.framePeriod = 1 / frate
+        self.flips = np.full(int(frate * maxSeconds), np.nan)   # flip times of the current trial
+        self.n = 0
+        self.overflow = 0
+        self.trial = None
+        self.trials = []    # one summary tuple per trial
+
+    def startTrial(self, blockType, blockCounter, label=''):
+        self.trial = (blockType, blockCounter, label)
+        self.n = 0
+        self.overflow = 0
+
+    def record(self, flipT):
+        # store the time returned by win.flip()
+        if self.n < len(self.flips):
+            self.flips[self.n] = flipT
+            self.n += 1
+        else:
+            self.overflow += 1
+
+    def gap(self):
+        # the interval to the next flip is not a frame (e.g. after core.wait)
+        self.record(np.nan)
+
+    def endTrial(self):
+        if self.trial is None:
+            return
+        intervals = np.diff(self.flips[:self.n])
+        intervals = intervals[~np.isnan(intervals)]
+        dropped = np.maximum(np.round(intervals / self.framePeriod) - 1, 0)
+        dropped[intervals <= dropFactor * self.framePeriod] = 0
+        meanInterval = intervals.mean() if len(intervals) else np.nan
+        maxInterval = intervals.max() if len(intervals) else np.nan
+        frames = np.count_nonzero(~np.isnan(self.flips[:self.n]))
+        self.trials.append(self.trial + (frames, int(dropped.sum()), int(dropped[:onsetFrames].sum()),
+                                         meanInterval, maxInterval, self.overflow))
+        self.trial = None
+
+    def blockSummary(self):
+        # aggregate trial summaries per (blockType, blockCounter), in session order
+        blocks = {}
+        for blockType, blockCounter, label, frames, dropped, onsetDropped, meanInterval, maxInterval, overflow in self.trials:
+            block = blocks.setdefault((blockType, blockCounter), [0, 0, 0, 0, 0, 0.0])
+            block[0] += 1
+            block[1] += frames
+            block[2] += dropped
+            block[3] += dropped > 0
+            block[4] += onsetDropped > 0
+            block[5] = np.nanmax([block[5], maxInterval])
+        return [key + tuple(values) for key, values in blocks.items()]
+
+    def saveReport(self, trialsPath, blocksPath):
+        with open(trialsPath, 'w', encoding='utf8') as trialsFile:
+            trialsFile.write(trialHeader)
+            for trial in self.trials:
+                trialsFile.write('%s,%i,%s,%i,%i,%i,%.6f,%.6f,%i\n' % trial)
+        with open(blocksPath, 'w', encoding='utf8') as blocksFile:
+            blocksFile.write(blockHeader)
+            for block in self.blockSummary():
+                blocksFile.write('%s,%i,%i,%i,%i,%i,%i,%.6f\n' % block)
+                blockType, blockCounter, trials, frames, dropped, trialsWithDrops, trialsWithOnsetDrops, maxInterval = block
+                print('%s block %i: %i trials, %i dropped frames (%i trials with drops, %i at color onset), max interval %.1f ms'
+                      % (blockType, blockCounter, trials, dropped, trialsWithDrops, trialsWithOnsetDrops, maxInterval * 1000))
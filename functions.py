@@ -4,338 +4,553 @@ Created on Thu Nov 24 15:18:39 2022
 
 @author: karol
 """
+import os
+import random
 import numpy as np
-import matplotlib.pyplot as plt
-from math import log
-from scipy.optimize import curve_fit
+from psychopy import core, event
+
+from adaptivecal import AdaptiveCalibration
+from callog import stepRow, startRow, estimateRow, intervalRow
+from expfit import fitExponential, inverseExponential, bootstrapIntervals
+from protocol import calWait, calCeiling, calMarker, calMaxCI
+from reports import calibrationFigure, calFigurePath
+from trialstore import trialRecord
+
+# Every function takes the session (session.py): window, devices, stimuli and the current participant
+
+# Present stimuli for a given time, redrawing and flipping every frame (flips are recorded)
+# The presentation ends duration after its first flip, so dropped frames do not lengthen it;
+# the nominal number of frames only caps the loop
+def presentFor(session, duration, *stims):
+    win = session.win
+    framePeriod = 1 / session.frate
+    onset = None
+    for frameN in range(int(round(duration * session.frate))):
+        for stim in stims:
+            stim.draw()
+        flipT = win.flip()
+        session.frameTimer.record(flipT)
+        if onset is None:
+            onset = flipT
+        if flipT >= onset + duration - 1.5 * framePeriod:   # the next screen's first flip is due at onset + duration
+            break
 
 # Using rating scale pratice
-def ratingPractice():
-    while ratingScale.noResponse:
-        instructionPractice.draw()
-        ratingScale.draw()
-        win.flip()
+def ratingPractice(session):
+    win = session.win
+    stimuli = session.stimuli
+    ratingScale = stimuli.ratingScale
+    ratingScale.markerStart = random.randint(0, 100)    # new random start position for every participant
+    ratingScale.reset()
+
+    session.ratingScreen.run(ratingScale, stimuli.instructionPractice)
     ratingPrac = ratingScale.getRating()
     ratingScale.noResponse = True
 
     while ratingPrac != 0:
-        instructionPracticeOnceAgain.draw()
+        stimuli.instructionPracticeOnceAgain.draw()
         win.flip()
         core.wait(3)
-        while ratingScale.noResponse:
-            instructionPractice.draw()
-            ratingScale.draw()
-            win.flip()
+        session.ratingScreen.run(ratingScale, stimuli.instructionPractice)
         ratingPrac = ratingScale.getRating()
         ratingScale.noResponse = True
-        
+
+###############################################################################
+# %% Pain stimulation
+###############################################################################
+
+#Apply electric shocks in series. Number of shocks in series determined by 'rep', intensity by 'demand' (1 = 0.1mA)
+# The series is delivered by the stimulation thread (stimulation.py); returns the PulseTrain at once
+def electricalStim(session, rep, demand):
+    return session.stimulator.start(demand, rep)
+
 ###############################################################################
 # %% Calibration
 ###############################################################################
-stimInt = []    # stimulus intensities for one repeat of calibration
-stimVAS = []    # stimulus ratings from one repeat of calibration
-stimIntTotal =[]    # all stimulus intensities from calibration
-stimVASTotal =[]    # all stimulus ratings from calibration
-
-def calibration():
-       
-    stimRange = np.arange(1, 150, 1)
-        
-    for stim in stimRange:
-        ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
-                                     markerColor='grey', markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
-                                     acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='white', mouseOnly = True)
-        
-        ser.write(str.encode(calMarker))    # send calibration marker
+
+def calibration(session):
+    win = session.win
+    stimuli = session.stimuli
+    markers = session.markers
+    frameTimer = session.frameTimer
+    dataWriter = session.dataWriter
+    stimInt = []    # stimulus intensities for one repeat of calibration
+    stimVAS = []    # stimulus ratings from one repeat of calibration
+    if session.calSteps is None:    # new series; otherwise the series is resumed
+        session.calSeries += 1
+        session.calSteps = []
+        session.writeRows((session.filenameCal, startRow(session.calSeries, session.calStart, core.getTime(), session.resumes)))
+    session.telemetry.publish('phase', name='calibration', series=session.calSeries)
+
+    # adaptive ascending procedure (see adaptivecal.py) instead of the 1..149 sweep,
+    # starting at the safe start intensity from the calibration prior
+    calEngine = AdaptiveCalibration(start=session.calStart, ceiling=calCeiling)
+    # steps done before a resume are replayed, which restores the procedure where it stopped
+    for stimDone, ratingDone in session.calSteps:
+        calEngine.update(stimDone, ratingDone)
+        if ratingDone is not None:
+            stimInt.append(stimDone)
+            stimVAS.append(ratingDone)
+    step = len(session.calSteps)    # stimuli delivered in this series
+
+    stim = calEngine.next()
+    while stim is not None:
+        ratingScale = stimuli.scalePool.get('grey')    # reset the rating scale marker position
+
+        markers.send(calMarker, 'calibration')    # send calibration marker
         core.wait(calWait)  # time to next stimulus
-        fixCross.draw()     # display fixation point
+        stimuli.fixCross.draw()     # display fixation point
         win.flip()
         core.wait(0.2)
-        
-        ser.write(str.encode('00')) # clear marker
-        
-        electricShock.demand = int(stim*10) # change electric shock intensity based on steps from calibration; value must be integer
-        electricalStim(3) # apply series of 3 electric shocks
-        
+
+        markers.send('00') # clear marker
+
+        train = electricalStim(session, 3, int(stim*10)) # apply series of 3 electric shocks; intensity based on steps from calibration, value must be integer
+        presentFor(session, train.duration, stimuli.fixCross)    # fixation stays on screen during the series
+        train.wait()
+        step += 1
+
         if not stimVAS:         # check if stimVAS list is empty; empty list will return bool=False; if stimVAS not empty it means pp already felt sth and no need to ask about it
-            feelSth.draw()     # display question if pp feel anything
+            stimuli.feelSth.draw()     # display question if pp feel anything
             win.flip()
-        
+
             answer = event.waitKeys(keyList=['a', 'apostrophe'])     # wait for keypress
-        
+
             if answer[0] == 'apostrophe':       # if not feeling stimulus continue to the next intensity; else show raint scale
                 win.flip()
+                session.writeRows((session.filenameCal, stepRow(session.calSeries, step, stim, None, core.getTime(), session.resumes)))
+                session.calSteps.append([stim, None])
+                session.trialDone()     # checkpoint
+                calEngine.update(stim, None)
+                stim = calEngine.next()
                 continue
-        
-        while ratingScale.noResponse:   # wait for rating
-            intRatingScale.draw()
-            ratingScale.draw()
-            win.flip()
-        
+
+        frameTimer.startTrial('calibration', session.calSeries, stim)
+        session.ratingScreen.run(ratingScale, stimuli.intRatingScale, frameTimer=frameTimer)   # wait for rating
+        frameTimer.endTrial()
+
         rating = ratingScale.getRating()   # write rating to variable
         ratingScale.noResponse = True   # clear response from rating scale
 
         stimVAS.append(rating)
         stimInt.append(stim)
         win.flip()
-        
-        # quit loop if rating is 7 or more
+
+        # Save the rated stimulus to the file (one row per stimulus)
+        session.writeRows((session.filenameCal, stepRow(session.calSeries, step, stim, rating, core.getTime(), session.resumes)),    # queued, written by the writer thread
+                          (session.filenameRatings, session.ratingScreen.trace.row('calibration', session.calSeries, stim, rating, ratingScale.getRT(), session.resumes)))
+        session.telemetry.publish('trial', blockType='calibration', blockCounter=session.calSeries, label=stim, marker=calMarker, rating=rating)
+        dataWriter.sync('trial')
+        session.calSteps.append([stim, rating])
+        session.trialDone()     # checkpoint
+
+        # quit loop if rating is 70 or more
         if rating >= 70:
             break
 
-        # Save current calibration series data to the file
-        dataFileCal = open(filenameCal, 'a')     # open for writing 'comma-separated-values' file
-        dataFileCal.write('%s,%s\n' %(stimInt, stimVAS))
-        dataFileCal.close()
-    
+        calEngine.update(stim, rating)   # choose the next intensity
+        stim = calEngine.next()
+
+    dataWriter.sync('block')
+
+    if stimInt:
+        session.calThresholds.append(stimInt[0])    # first felt intensity of the series
+
     # Add intensity and rating values from current calibration series to total list
-    global stimIntTotal, stimVASTotal
-    stimIntTotal += stimInt
-    stimVASTotal += stimVAS
-    
-    # Clear current list
-    stimVAS.clear()
-    stimInt.clear()
+    session.stimIntTotal += stimInt
+    session.stimVASTotal += stimVAS
+    session.calSteps = None     # series done
 
 ###############################################################################
 # %% Exponential curve fit
 ###############################################################################
 
-def curveFit():
-    
-    x=stimIntTotal
-    y=stimVASTotal
-    
-    # set plot parameters
-    curvepoints_qty=100
-    y_height=100
-    
-    # Fit the function a * np.exp(b * t) to x and y
-    popt, pcov = curve_fit(lambda t, a, b: a * np.exp(b * t), x, y)
-    
-    # Extract the optimised parameters # nothing to change here
-    a = popt[0]
-    b = popt[1]
-    x_fitted = np.linspace(np.min(x), np.max(x), curvepoints_qty)
-    y_fitted = a * np.exp(b * x_fitted)
-
-    global estimationVAS40, estimationVAS50, estimationVAS60
-    estimationVAS40 = log(40/a) / b
-    estimationVAS50 = log(50/a) / b
-    estimationVAS60 = log(60/a) / b
+def curveFit(session):
+    dataWriter = session.dataWriter
+
+    x=session.stimIntTotal
+    y=session.stimVASTotal
+
+    # Fit the function a * np.exp(b * t) to x and y (log-linear seed, analytic Jacobian, bounds; see expfit.py)
+    a, b = fitExponential(x, y)
+
+    estimationVAS40, estimationVAS50, estimationVAS60 = inverseExponential([40, 50, 60], a, b)
+    session.estimationVAS40, session.estimationVAS50, session.estimationVAS60 = estimationVAS40, estimationVAS50, estimationVAS60
 
     print('VAS 40, VAS 50, VAS 60:', estimationVAS40, estimationVAS50, estimationVAS60)
-    
-    # Plot
-    ax = plt.axes()
-    ax.scatter(x, y, label='Raw data')
-    ax.plot(x_fitted, y_fitted, 'k', label='Fitted curve')
-    ax.set_title(r'Using curve\_fit() to fit an exponential function')
-    ax.set_ylabel('VAS rating')
-    ax.set_ylim(0, y_height)
-    ax.set_xlabel('intensity [mA]')
-    ax.legend()
-
-    #mark point in graph
-    ax.axhline(50, ls="--", color="grey")
-    ax.axvline(estimationVAS50, ls="--", color="grey")
-    ax.plot(estimationVAS50, 50, c="tab:orange", marker="o", markersize=15, alpha=0.5)
-    plt.show()
-    
-    # Save total calibration data to the file
-    dataFileCal = open(filenameCal, 'a')     # open for writing 'comma-separated-values' file
-    dataFileCal.write('%s,%s,%s\n' %(group, stimIntTotal, stimVASTotal))
-    dataFileCal.write('\nEstimation for 40 on VAS: %f\n' %(estimationVAS40))
-    dataFileCal.write('\nEstimation for 50 on VAS: %f\n' %(estimationVAS50))
-    dataFileCal.write('\nEstimation for 60 on VAS: %f\n' %(estimationVAS60))
-    dataFileCal.close()
-    
+
+    # 95% bootstrap intervals of the estimates (resampled ratings refit at once, within 0.2 s; see expfit.py)
+    lower, upper, nBoot = bootstrapIntervals(x, y, a, b, (40, 50, 60), seed=session.seed)
+    for target, low, high in zip((40, 50, 60), lower, upper):
+        print('VAS %i 95%% CI: %.2f - %.2f' % (target, low, high))
+    unstable = not (upper[1] - lower[1] <= calMaxCI * estimationVAS50)     # also when the interval is nan
+    if unstable:
+        print('WARNING: unstable calibration, the VAS 50 interval is wider than %i%% of the estimate (%i resamples)' % (calMaxCI * 100, nBoot))
+    session.telemetry.publish('estimates', VAS40=estimationVAS40, VAS50=estimationVAS50, VAS60=estimationVAS60, a=a, b=b,
+                              ci50=[lower[1], upper[1]], unstable=unstable)
+
+    # Plot, saved as <data file>_CAL.png from the renderer thread (reports.py); the experiment goes on
+    session.figures.submit(calFigurePath(session.filenameCal), calibrationFigure, list(x), list(y), a, b, estimationVAS50, session.subID)
+
+    # Add this participant to the calibration prior for the next ones (before the estimates are
+    # written: a resume that recovers the estimates skips the curve fit, see Session.recoverTrials())
+    threshold = min(session.calThresholds) if session.calThresholds else np.nan
+    session.calPrior.add(os.path.basename(session.filenameCal), session.subID, session.group, a, b, threshold, session.calStart)
+
+    # Save the estimated intensities to the file (the ratings are already there)
+    session.writeRows(*[(session.filenameCal, estimateRow(target, estimation, core.getTime(), session.resumes))
+                        for target, estimation in zip((40, 50, 60), (estimationVAS40, estimationVAS50, estimationVAS60))],
+                      *[(session.filenameCal, intervalRow(target, low, high, 0.95, core.getTime(), session.resumes))
+                        for target, low, high in zip((40, 50, 60), lower, upper)])
+    dataWriter.sync('block')
+
 ###############################################################################
 # %% Blocks without pain stimulation
 ###############################################################################
 
-def noPainBlocks(blockType):
-    blockCounter = 0   # set block counter to 0
-    bcgColor = colorTrials
-    
+def noPainBlocks(session, blockType):
+    stimuli = session.stimuli
+    slideColor = stimuli.slideColor
+    markers = session.markers
+    frameTimer = session.frameTimer
+    dataWriter = session.dataWriter
+
     # Assign block parameters
     if blockType == 'expectation':
-        nrBlocks = expectBlockNr
-        VASratingScale = expectRatingScale
-        colorWait = expectWait
-        marker = expectationMarker
+        VASratingScale = stimuli.expectRatingScale
     elif blockType == 'colors':
-        nrBlocks = colorBlockNr
-        VASratingScale = noScale
-        colorWait = colorOnlyWait
-        marker = colorsOnlyMarker
-    
+        VASratingScale = stimuli.noScale
+
     VASratingScale.setColor('black', colorSpace='rgb')
-    fixCross.setColor('black', colorSpace='rgb')
-    
-    while blockCounter != nrBlocks :   # check if the desired number of blocks is reached
-        # Shuffle the list with background colors
-        random.shuffle(bcgColor)
-        blockCounter += 1   # adds one to block counter
+    stimuli.fixCross.setColor('black', colorSpace='rgb')
+    session.telemetry.publish('phase', name=blockType)
+
+    # Blocks and color order come from the precompiled schedule (schedule.py)
+    skip = session.trialsDone   # trials done before a resume
+    trialIndex = 0
+    for blockCounter, block in session.schedule.blocks(blockType):
 
         # Single trial: present colors and ask for expectation ratings
-        for thisColor in bcgColor:
-            # Reset the rating scale marker position aka initialize rating scale component once again
+        for trial in block:
+            trialIndex += 1
+            if trialIndex <= skip:
+                continue
+            # Reset the rating scale marker position (prebuilt scale from the pool)
             if blockType == 'expectation':
-                ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
-                                                 markerColor='black', markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
-                                                 acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='black', lineColor='black', mouseOnly=True)
+                ratingScale = stimuli.scalePool.get('black')
 
-            thisMarker = marker + thisColor['colorMarker']  # set the marker value
-            ser.write(str(thisMarker).encode())
-            
+            colorName, marker = str(trial['bcgColor']), str(trial['marker'])
             rating = None
-            slideColor.setColor(thisColor['colorRGB'], colorSpace='rgb') # change the background color
-            slideColor.draw()
-            win.flip()
-            
-            core.wait(colorWait)    # color presentation time
-            
-            ser.write(str.encode('00')) # clear marker
-            
+            slideColor.setColor(trial['rgb'], colorSpace='rgb') # change the background color
+            frameTimer.startTrial(blockType, blockCounter, colorName)
+            markers.sendOnFlip(marker, colorName)   # marker fires with the color onset
+            presentFor(session, trial['colorWait'], slideColor)    # color presentation time
+
+            markers.send('00') # clear marker
+
             if blockType == 'expectation':
-                while ratingScale.noResponse:   # wait for rating via slider
-                    slideColor.draw()
-                    VASratingScale.draw()
-                    ratingScale.draw()
-                    win.flip()
-                        
+                session.ratingScreen.run(ratingScale, slideColor, VASratingScale, frameTimer=frameTimer)   # wait for rating via slider
+
                 rating = ratingScale.getRating()   # write rating to variable
                 ratingScale.noResponse = True   # clear response from rating scale
-                
+
+            frameTimer.endTrial()
+
             # Save rating to the file
-            dataFile = open(filename, 'a')     # open for writing 'comma-separated-values' file
-            dataFile.write('%s,%s,%i,%s,%i,%s\n' %(group, blockType, blockCounter, thisColor["colorName"], thisMarker, rating))
-            dataFile.close()
-            
-def baselineExpectation():
+            rows = [(session.filename, '%s,%s,%i,%s,%s,%s\n' %(session.group, blockType, blockCounter, colorName, marker, rating)),
+                    (session.filenameTrials, trialRecord(session.subID, session.group, blockType, blockCounter, colorName, marker, rating))]
+            if blockType == 'expectation':
+                rows.append((session.filenameRatings, session.ratingScreen.trace.row(blockType, blockCounter, colorName, rating, ratingScale.getRT(), session.resumes)))
+            session.writeRows(*rows)
+            session.telemetry.publish('trial', blockType=blockType, blockCounter=blockCounter, label=colorName, marker=marker, rating=rating)
+            dataWriter.sync('trial')
+            session.trialDone()     # checkpoint
+
+        dataWriter.sync('block')
+
+    slideColor.reset()  # default window color for the next instructions
+
+def baselineExpectation(session):
+    stimuli = session.stimuli
+    slideColor = stimuli.slideColor
+    markers = session.markers
+    frameTimer = session.frameTimer
+    dataWriter = session.dataWriter
     blockType = 'baselineExpectation'
-    blockCounter = 0   # set block counter to 0
-    bcgColor = baselineTrials
-    nrBlocks = expectBlockNr
-    VASratingScale = baseExpectRatingScale
-    colorWait = expectWait
+    VASratingScale = stimuli.baseExpectRatingScale
+    session.telemetry.publish('phase', name=blockType)
 
-    while blockCounter != nrBlocks :   # check if the desired number of blocks is reached
-        blockCounter += 1   # adds one to block counter
+    skip = session.trialsDone   # trials done before a resume
+    trialIndex = 0
+    for blockCounter, block in session.schedule.blocks(blockType):
 
         # Single trial: present colors and ask for expectation ratings
-        for thisColor in bcgColor:
-            # Reset the rating scale marker position aka initialize rating scale component once again
-            ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
-                                             markerColor='grey', markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
-                                             acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='white', mouseOnly=True)
-                
-            marker = baseExpectMarker  # set the marker value
-            ser.write(marker.encode())
-            
+        for trial in block:
+            trialIndex += 1
+            if trialIndex <= skip:
+                continue
+            # Reset the rating scale marker position (prebuilt scale from the pool)
+            ratingScale = stimuli.scalePool.get('grey')
+
+            colorName, marker = str(trial['bcgColor']), str(trial['marker'])
             rating = None
-            slideColor.setColor(thisColor['colorRGB'], colorSpace='rgb') # change the background color
-            slideColor.draw()
-            win.flip()
-            
-            core.wait(colorWait)    # color presentation time
-            
-            ser.write(str.encode('00')) # clear marker
-            
-            while ratingScale.noResponse:   # wait for rating via slider
-                slideColor.draw()
-                VASratingScale.draw()
-                ratingScale.draw()
-                win.flip()
-                        
+            slideColor.setColor(trial['rgb'], colorSpace='rgb') # change the background color
+            frameTimer.startTrial(blockType, blockCounter, colorName)
+            markers.sendOnFlip(marker, colorName)   # marker fires with the color onset
+            presentFor(session, trial['colorWait'], slideColor)    # color presentation time
+
+            markers.send('00') # clear marker
+
+            session.ratingScreen.run(ratingScale, slideColor, VASratingScale, frameTimer=frameTimer)   # wait for rating via slider
+            frameTimer.endTrial()
+
             rating = ratingScale.getRating()   # write rating to variable
             ratingScale.noResponse = True   # clear response from rating scale
-                
+
             # Save rating to the file
-            dataFile = open(filename, 'a')     # open for writing 'comma-separated-values' file
-            dataFile.write('%s,%s,%i,%s,%s,%s\n' %(group, blockType, blockCounter, thisColor["colorName"], marker, rating))
-            dataFile.close()            
+            session.writeRows((session.filename, '%s,%s,%i,%s,%s,%s\n' %(session.group, blockType, blockCounter, colorName, marker, rating)),
+                              (session.filenameTrials, trialRecord(session.subID, session.group, blockType, blockCounter, colorName, marker, rating)),
+                              (session.filenameRatings, session.ratingScreen.trace.row(blockType, blockCounter, colorName, rating, ratingScale.getRT(), session.resumes)))
+            session.telemetry.publish('trial', blockType=blockType, blockCounter=blockCounter, label=colorName, marker=marker, rating=rating)
+            dataWriter.sync('trial')
+            session.trialDone()     # checkpoint
+
+        dataWriter.sync('block')
+
+    slideColor.reset()  # default window color for the next instructions
 
 ###############################################################################
 # %% Blocks with pain stimulation
 ###############################################################################
-baselineRatings = []   # sets a list to gather ratings from the baseline
 
-def painBlocks(blockType):
-    blockCounter = 0   # set block counter to 0
+def painBlocks(session, blockType):
+    win = session.win
+    stimuli = session.stimuli
+    slideColor = stimuli.slideColor
+    fixCross = stimuli.fixCross
+    markers = session.markers
+    frameTimer = session.frameTimer
+    dataWriter = session.dataWriter
 
-    VASratingScale = intRatingScale    # refers to intensity rating text
-    colorWait = intWait     # refers to time of color background display
+    VASratingScale = stimuli.intRatingScale    # refers to intensity rating text
 
     # Assign block parameters
     if blockType == 'intensity':
-        nrBlocks = intBlockNr   # refers to number of intensity blocks
-        bcgColor = colorTrials  # refers to list of colors used in experiment
+        scaleStyle = 'black'
         VASratingScale.setColor('black', colorSpace='rgb')
         fixCross.setColor('black', colorSpace='rgb')
     elif blockType == 'baseline':
-        nrBlocks = baseBlockNr
-        bcgColor = baselineTrials
+        scaleStyle = 'grey'
         VASratingScale.setColor('white', colorSpace='rgb')
         fixCross.setColor('white', colorSpace='rgb')
-    
-    while blockCounter != nrBlocks :   # check if the desired number of blocks is reached
-        # Shuffle the list with background colors
-        random.shuffle(bcgColor)
-        blockCounter += 1   # adds one to block counter
+    session.telemetry.publish('phase', name=blockType, intensity=session.estimationVAS)
+
+    # Blocks and color order come from the precompiled schedule (schedule.py)
+    skip = session.trialsDone   # trials done before a resume
+    trialIndex = 0
+    for blockCounter, block in session.schedule.blocks(blockType):
 
         # Single trial: present colors and ask for expectation ratings
-        for thisColor in bcgColor:
-            # Reset the rating scale marker position aka initialize rating scale component once again
-            if blockType == 'baseline':
-                ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
-                                             markerColor='grey', markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
-                                             acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='white', mouseOnly=True)
-                marker = baseMarker
-            elif blockType == 'intensity':
-                ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
-                                                 markerColor='black', markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
-                                                 acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='black', lineColor='black',
-                                                 mouseOnly=True)
-                thisMarker = painMarker + thisColor['colorMarker']
-                marker = str(thisMarker)
-                
-            ser.write(marker.encode())
-            
-            slideColor.setColor(thisColor['colorRGB'], colorSpace='rgb') # change the background color
-            slideColor.draw()
-            win.flip()
-            
-            core.wait(colorWait)    # color presentation time
-            
-            ser.write(str.encode('05'))
+        for trial in block:
+            trialIndex += 1
+            if trialIndex <= skip:
+                continue
+            # Reset the rating scale marker position (prebuilt scale from the pool)
+            ratingScale = stimuli.scalePool.get(scaleStyle)
+
+            colorName, marker = str(trial['bcgColor']), str(trial['marker'])
+            colorWait = trial['colorWait']     # refers to time of color background display
+            slideColor.setColor(trial['rgb'], colorSpace='rgb') # change the background color
+            frameTimer.startTrial(blockType, blockCounter, colorName)
+            markers.sendOnFlip(marker, colorName)   # marker fires with the color onset
+            presentFor(session, colorWait, slideColor)    # color presentation time
 
             slideColor.draw()
             fixCross.draw()
-            win.flip()
-            
-            electricShock.demand = int(estimationVAS*10) # set electric shock intensity
-            electricalStim(3) # apply series of 3 electric shocks
-            
-            slideColor.draw()
-            win.flip()
-            core.wait(colorWait)
-            ser.write(str.encode('00'))
-            
-            while ratingScale.noResponse:   # wait for rating
-                slideColor.draw()
-                VASratingScale.draw()
-                ratingScale.draw()
-                win.flip()
-                    
+            markers.sendOnFlip('05', 'fixation')   # marker fires with the fixation onset
+            frameTimer.record(win.flip())
+
+            train = electricalStim(session, 3, int(session.estimationVAS*10)) # apply series of 3 electric shocks at the estimated intensity
+            presentFor(session, train.duration, slideColor, fixCross)    # the window keeps flipping during the series
+            train.wait()
+
+            presentFor(session, colorWait, slideColor)
+            markers.send('00')
+
+            session.ratingScreen.run(ratingScale, slideColor, VASratingScale, frameTimer=frameTimer)   # wait for rating
+            frameTimer.endTrial()
+
             rating = ratingScale.getRating()   # write rating to variable
             ratingScale.noResponse = True   # clear response from rating scale
-            
+
             if blockType == 'baseline':
-                baselineRatings.append(rating)
-            
+                session.baselineRatings.append(rating)
+
             # Save rating to the file
-            dataFile = open(filename, 'a')     # open for writing 'comma-separated-values' file
-            dataFile.write('%s,%s,%i,%s,%s,%s\n' %(group, blockType, blockCounter, thisColor["colorName"], marker, rating))
-            dataFile.close()
\ No newline at end of file
+            session.writeRows((session.filename, '%s,%s,%i,%s,%s,%s\n' %(session.group, blockType, blockCounter, colorName, marker, rating)),
+                              (session.filenameTrials, trialRecord(session.subID, session.group, blockType, blockCounter, colorName, marker, rating)),
+                              (session.filenameRatings, session.ratingScreen.trace.row(blockType, blockCounter, colorName, rating, ratingScale.getRT(), session.resumes)))
+            session.telemetry.publish('trial', blockType=blockType, blockCounter=blockCounter, label=colorName, marker=marker, rating=rating)
+            dataWriter.sync('trial')
+            session.trialDone()     # checkpoint
+
+        dataWriter.sync('block')
+
+    slideColor.reset()  # default window color for the next instructions
+
+###############################################################################
+# %% EXPERIMENT FLOW
+###############################################################################
+
+def runParticipant(session):
+    win = session.win
+    stimuli = session.stimuli
+    dataWriter = session.dataWriter
+
+    stimuli.resetColors()   # the previous participant's blocks left some stimuli black
+
+    # Every phase is checkpointed when done; a resumed session skips the phases done before
+    # (checkpoint.py) and the block functions skip the trials done in the current phase
+    if not session.isDone('practice'):
+        session.startPhase('practice')
+        # Present start instructions
+        stimuli.instructionStart.draw() # prepare an object to be drawn on-screen
+        win.flip()    # make the object visible with the next screen refresh flipq
+        event.waitKeys(keyList=['return', 'q'])    # wait for any of these keys to be pressed
+        win.flip()
+        stimuli.fixCross.draw()
+        win.flip()
+        core.wait(2)
+        stimuli.instructionStart2.draw()
+        stimuli.ratingScaleSample.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        win.flip()
+        stimuli.instructionStart3.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        win.flip()
+
+        # Practice using rating scale
+        ratingPractice(session)
+        session.phaseDone('practice')
+
+    if not session.isDone('calibration1'):
+        session.startPhase('calibration1')
+        # Present calibration instruction
+        stimuli.instructionStart4.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        win.flip()
+
+        # Run calibration
+        calibration(session)
+        session.phaseDone('calibration1')
+
+    if not session.isDone('calibration2'):
+        session.startPhase('calibration2')
+        stimuli.pause.draw()
+        win.flip()
+        dataWriter.sync('pause')
+        core.wait(60)    # should be 60
+        stimuli.pauseCalContinue.draw()
+        win.flip()
+        core.wait(5)    # should be 5
+        win.flip()
+        calibration(session)
+        session.phaseDone('calibration2')
+
+    if not session.isDone('curveFit'):
+        curveFit(session)
+        session.phaseDone('curveFit')
+
+    # Baseline
+    if not session.isDone('baseline'):
+        session.startPhase('baseline')
+        stimuli.instructionInt.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+
+        session.estimationVAS = session.estimationVAS50
+        painBlocks(session, 'baseline')   # run baseline block
+        session.baselineMean = sum(session.baselineRatings)/len(session.baselineRatings)
+        print(session.baselineMean)
+        session.telemetry.publish('baseline', mean=session.baselineMean)
+        session.phaseDone('baseline')
+    baselineMean = session.baselineMean
+
+    # change the intensity of stimuli and repeat baseline if the mean ratings where lower than 20 or higher than 80
+    if (baselineMean <= 20 or baselineMean > 80) and not session.isDone('baselineRepeat'):
+        session.startPhase('baselineRepeat')
+        stimuli.instructionRepeat.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        win.flip()
+        session.estimationVAS = session.estimationVAS60 if baselineMean <= 20 else session.estimationVAS40
+        painBlocks(session, 'baseline')   # run baseline block again
+        session.phaseDone('baselineRepeat')
+
+    # Expectations for baseline
+    if not session.isDone('baselineExpectation'):
+        session.startPhase('baselineExpectation')
+        stimuli.instructionExpect.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        baselineExpectation(session)   # run baseline expectations block
+        session.phaseDone('baselineExpectation')
+
+    # Colors only
+    if not session.isDone('colors'):
+        session.startPhase('colors')
+        stimuli.instructionColors.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+
+        noPainBlocks(session, 'colors')   # run colors only block
+        session.phaseDone('colors')
+
+    # Manipulation instruction depending on the group
+    if not session.isDone('manipulation'):
+        session.startPhase('manipulation')
+        stimuli.instructionManipulation1.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+        stimuli.instructionManipulation2.draw()
+        win.flip()
+        dataWriter.sync('pause')
+        core.wait(45)   # should be 45
+        if session.group == 'congruent':
+            stimuli.instructionManipulation3Congruent.draw()
+            win.flip()
+            event.waitKeys(keyList=['return', 'q'])
+        elif session.group == 'incongruent':
+            stimuli.instructionManipulation3Incongruent.draw()
+            win.flip()
+            event.waitKeys(keyList=['return', 'q'])
+        session.phaseDone('manipulation')
+
+    # Expectations
+    if not session.isDone('expectation'):
+        session.startPhase('expectation')
+        stimuli.instructionExpect.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+
+        noPainBlocks(session, 'expectation')   # run expectations block
+        session.phaseDone('expectation')
+
+    # Pain
+    if not session.isDone('intensity'):
+        session.startPhase('intensity')
+        stimuli.instructionInt.draw()
+        win.flip()
+        event.waitKeys(keyList=['return', 'q'])
+
+        painBlocks(session, 'intensity')   # run pain blocks
+        session.phaseDone('intensity')
+
+    stimuli.goodbye.draw()
+    win.flip()
+    event.waitKeys(keyList=['space', 'q'])
+    session.finished = True     # nothing left to resume
+    session.checkpoint()
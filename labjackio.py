@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Trigger output on the EIO lines of a LabJack U3.
+
+Every operation is a single getFeedback() transaction (one USB round trip)
+instead of one writeRegister() per edge: setup() sets the direction and the
+state of the lines together, pulse() sends the rising edge, a short
+on-device wait (the pulse width) and the falling edge. The duration of every
+transaction is kept for the latency report.
+
+DryRunU3 stands in for the device (tests, benchmarks, no hardware): it
+records every transaction and can add a fixed latency.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Feedback commands of the u3 library (psychopy.hardware.labjacks is a module that re-exports it);
+# stand-ins with the same fields only when there is no device library
+try:
+    from psychopy.hardware.labjacks import u3
+    PortDirWrite, PortStateWrite, WaitShort = u3.PortDirWrite, u3.PortStateWrite, u3.WaitShort
+except ImportError:
+    PortDirWrite = namedtuple('PortDirWrite', 'Direction WriteMask')
+    PortStateWrite = namedtuple('PortStateWrite', 'State WriteMask')
+    WaitShort = namedtuple('WaitShort', 'Time')
+
+waitShortUnit = 128e-6  # s per WaitShort unit on the U3
+eioMask = [0, 0xFF, 0]  # FIO, EIO, CIO: all EIO lines (was register 6701 with mask 0xFF00)
+
+
+class TriggerOutput:
+
+    def __init__(self, device, pulseWidth=0.001):
+        self.device = device
+        self.pulseWidth = WaitShort(Time=max(1, min(255, round(pulseWidth / waitShortUnit))))
+        self.latencies = []     # duration of every transaction in s
+        self.lock = threading.Lock()
+
+    def setup(self):
+        # EIO lines as outputs, low
+        return self.transaction(PortDirWrite(Direction=eioMask, WriteMask=eioMask),
+                                PortStateWrite(State=[0, 0, 0], WriteMask=eioMask))
+
+    def pulse(self):
+        # rising edge, pulse width, falling edge
+        return self.transaction(PortStateWrite(State=eioMask, WriteMask=eioMask),
+                                self.pulseWidth,
+                                PortStateWrite(State=[0, 0, 0], WriteMask=eioMask))
+
+    def transaction(self, *commands):
+        # one getFeedback() round trip; returns its duration in s
+        with self.lock:
+            start = time.perf_counter()
+            self.device.getFeedback(*commands)
+            latency = time.perf_counter() - start
+            self.latencies.append(latency)
+        return latency
+
+    def latencySummary(self):
+        # (n, median, p95, max) of the transaction durations in ms
+        if not self.latencies:
+            return 0, np.nan, np.nan, np.nan
+        latencies = np.array(self.latencies) * 1000
+        return len(latencies), np.median(latencies), np.percentile(latencies, 95), latencies.max()
+
+    def close(self):
+        self.device.close()
+
+
+class DryRunU3:
+    """Records every feedback transaction as (time, commands); no hardware."""
+
+    def __init__(self, latency=0.0, clock=time.perf_counter):
+        self.latency = latency
+        self.clock = clock
+        self.transactions = []
+
+    def getFeedback(self, *commands):
+        if self.latency:
+            time.sleep(self.latency)
+        self.transactions.append((self.clock(), commands))
+        return [None] * len(commands)
+
+    def writeRegister(self, addr, value):
+        # single register write, one round trip (as the old trigger code did)
+        if self.latency:
+            time.sleep(self.latency)
+        self.transactions.append((self.clock(), ((addr, value),)))
+        return value
+
+    def close(self):
+        pass
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic participant for simulations.
+
+Pain ratings follow the same model curveFit() assumes, VAS = a * exp(b * x)
+(x in stimulus units, 1 = 0.1 mA), with Gaussian rating noise clipped to
+0-100. Stimuli below the detection threshold are not felt.
+"""
+import numpy as np
+
+
+class SyntheticParticipant:
+
+    def __init__(self, a, b, threshold, noiseSD=5, seed=None):
+        self.a = a
+        self.b = b
+        self.threshold = threshold
+        self.noiseSD = noiseSD
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def random(cls, rng, noiseSD=5):
+        # draw a plausible participant: detection at 0.3-4 mA, VAS 70 reached 1-10 mA above it
+        threshold = rng.uniform(3, 40)
+        x70 = min(threshold + rng.uniform(10, 100), 145)
+        r0 = rng.uniform(1, 10)     # rating at the detection threshold
+        b = np.log(70 / r0) / (x70 - threshold)
+        a = r0 * np.exp(-b * threshold)
+        return cls(a, b, threshold, noiseSD, seed=rng.integers(2**32))
+
+    def feels(self, x):
+        return x >= self.threshold
+
+    def expected(self, x):
+        return min(self.a * np.exp(self.b * x), 100)
+
+    def rate(self, x):
+        return int(np.clip(round(self.expected(x) + self.rng.normal(0, self.noiseSD)), 0, 100))
+
+    def intensityFor(self, vas):
+        # true intensity giving the requested rating
+        return np.log(vas / self.a) / self.b
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Protocol parameters: block numbers, presentation times, colors and markers.
+"""
+
+expName = 'Experiment K5'
+psychopyVersion = '2021.2.3'
+groups = ['congruent', 'incongruent', 'color-ctrl']
+
+###############################################################################
+# %% Different parameters
+###############################################################################
+
+# Keys for the experiment
+rsp_keysCal = ['a', 'l'] # keys for calibration
+
+# Number of blocks
+intBlockNr = 6      # pain blocks
+expectBlockNr = 1   # expectation blocks
+colorBlockNr = 1    # color only blocks
+baseBlockNr = 6
+
+# Presentation times
+intWait = 6     # intensity trials
+expectWait = 6  # expectation trials
+calWait = 6     # calibration trials (time to next stimulus)
+calCeiling = 149    # highest calibration intensity (1 = 0.1mA)
+calMaxCI = 0.2      # calibration flagged as unstable when the 95% CI of the VAS 50 intensity is wider than this fraction of it
+colorOnlyWait = 6
+
+###############################################################################
+# %% Color stimuli parameters and markers
+###############################################################################
+
+# Color definitions, creating dictionaries
+red = {'colorName': 'red', 'colorRGB': [1.000,-1.000,-1.000], 'colorMarker': 1}
+blue = {'colorName': 'blue', 'colorRGB': [-1.000,0.004,1.000], 'colorMarker': 2}
+green = {'colorName': 'green', 'colorRGB': [-1.000,1.000,-1.000], 'colorMarker': 3}
+orange = {'colorName': 'orange', 'colorRGB': [1.000,0.004,-1.000], 'colorMarker': 4}
+yellow = {'colorName': 'yellow', 'colorRGB': [1.000,1.000,-1.000], 'colorMarker': 5}
+pink = {'colorName': 'pink', 'colorRGB': [1.000,-1.000,0.004], 'colorMarker': 6}
+grey = {'colorName': 'grey', 'colorRGB': [0.004,0.004,0.004], 'colorMarker': 7}
+white = {'colorName': 'white', 'colorRGB': [1.000,1.000,1.000], 'colorMarker': 8}
+black = {'colorName': 'black', 'colorRGB': [-1.000,-1.000,-1.000], 'colorMarker': 0}
+
+# Trial lists
+colorTrials = [red, blue, green, orange, yellow, pink, grey, white]   # list for color trials
+baselineTrials = [black]    # list for beseline trials
+
+# Markers
+calMarker = '01'    # marker for cailbration trials
+baseMarker = '02'
+baseExpectMarker = '03'
+colorsOnlyMarker = 10
+expectationMarker = 20
+painMarker = 30
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of prebuilt rating scales.
+
+Constructing visual.RatingScale builds all of its text, line and marker
+stimuli, which is one of the largest costs between two trials. The scales
+used in the trial loops only differ in their color scheme, so one scale per
+style is built at startup and reset before every trial instead.
+"""
+from psychopy import visual
+
+# Settings shared by every trial rating scale (0-100 VAS, mouse only)
+scaleArgs = dict(low=0, high=100, labels=['0', '100'], scale=None, tickMarks=[0, 100],
+                 markerStart=0, stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
+                 acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, mouseOnly=True)
+
+# Color schemes: 'grey' for black backgrounds, 'black' for colored backgrounds
+scaleStyles = {
+    'grey': dict(markerColor='grey', textColor='white'),
+    'black': dict(markerColor='black', textColor='black', lineColor='black'),
+}
+
+
+def buildRatingScale(win, style):
+    # build a new rating scale in the given style (the old per-trial approach)
+    return visual.RatingScale(win, **scaleArgs, **scaleStyles[style])
+
+
+class RatingScalePool:
+    """One prebuilt rating scale per style, reset instead of rebuilt per trial."""
+
+    def __init__(self, win, styles=tuple(scaleStyles)):
+        self.scales = {style: buildRatingScale(win, style) for style in styles}
+
+    def get(self, style):
+        # return the scale for this style with the marker back at markerStart
+        ratingScale = self.scales[style]
+        ratingScale.reset()
+        return ratingScale
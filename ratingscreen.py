@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Rating screens with a cached static layer.
+
+While a rating is given only the marker and the accept button change, but
+the background, the question and the whole rating scale were drawn again on
+every frame. run() draws the static part once per rating into a
+BufferImageStim (one textured quad): the given stimuli and, where the scale
+exposes them (RatingScale.visualDisplayElements: line, tick marks, labels),
+the static elements of the scale. Every frame then draws the layer and the
+scale without those elements. The accept box and its text are also in
+visualDisplayElements, but they pulse and change text while the rating is
+given, so they stay out of the layer and are drawn every frame.
+
+With idleFrames set, the loop stops drawing and flipping once the mouse has
+not moved for that many frames: the last frame stays on screen and the loop
+sleeps idleSleep at a time until the mouse moves or a button is pressed.
+The pause is marked in the frame log (FrameRecorder.gap()), so it is not
+counted as dropped frames.
+
+The flip time and marker position of every frame go to self.trace
+(ratingtrace.py), which is restarted by every run().
+"""
+import numpy as np
+from psychopy import core, visual
+
+from ratingtrace import RatingTrace
+
+
+class RatingScreen:
+
+    def __init__(self, win, mouse, frate, idleFrames=None, idleSleep=0.005):
+        self.win = win
+        self.mouse = mouse
+        self.trace = RatingTrace(frate)
+        self.idleFrames = idleFrames    # None = flip every frame
+        self.idleSleep = idleSleep
+
+    def run(self, ratingScale, *stims, frameTimer=None):
+        # wait for the rating; stims = static part of the screen in drawing order
+        elements, static, live = splitElements(ratingScale)
+        layer = visual.BufferImageStim(self.win, stim=list(stims) + static)
+        lastPos = np.array(self.mouse.getPos())
+        idle = 0
+        self.trace.start()
+        while ratingScale.noResponse:
+            if self.idleFrames is not None:
+                pos = np.array(self.mouse.getPos())
+                moved = np.any(pos != lastPos) or any(self.mouse.getPressed())
+                lastPos = pos
+                idle = 0 if moved else idle + 1
+                if idle > self.idleFrames:
+                    if idle == self.idleFrames + 1 and frameTimer is not None:
+                        frameTimer.gap()
+                    core.wait(self.idleSleep, hogCPUperiod=0)
+                    pumpEvents(self.win)
+                    continue
+            layer.draw()
+            drawDynamic(ratingScale, elements, live)
+            flipT = self.win.flip()
+            self.trace.record(flipT, ratingScale.markerPlacedAt)
+            if frameTimer is not None:
+                frameTimer.record(flipT)
+
+
+# Elements of visualDisplayElements that change while a rating is given
+liveElements = ('acceptBox', 'accept')
+
+def splitElements(ratingScale):
+    # (all, static, live) display elements of the scale; all = None if the scale does not expose them
+    elements = getattr(ratingScale, 'visualDisplayElements', None)
+    if elements is None:
+        return None, [], []
+    liveIds = {id(getattr(ratingScale, name)) for name in liveElements if hasattr(ratingScale, name)}
+    static = [element for element in elements if id(element) not in liveIds]
+    live = [element for element in elements if id(element) in liveIds]
+    return elements, static, live
+
+def drawDynamic(ratingScale, elements, live):
+    # draw the scale with only its live elements (the static ones are in the layer)
+    if elements is None:
+        ratingScale.draw()
+        return
+    ratingScale.visualDisplayElements = live
+    try:
+        ratingScale.draw()
+    finally:
+        ratingScale.visualDisplayElements = elements
+
+def pumpEvents(win):
+    # the mouse state is updated from the window events, which flip() dispatches otherwise
+    winHandle = getattr(win, 'winHandle', None)
+    if winHandle is not None:
+        winHandle.dispatch_events()
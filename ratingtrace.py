@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Slider trajectory and response time of every rating.
+
+The rating screen (ratingscreen.py) records the flip time and the marker
+position of every frame into preallocated arrays used as a ring buffer:
+recording a frame is two array assignments, and a rating longer than the
+buffer keeps its last maxSeconds. row() formats the trace at the end of the
+trial; it is written to the _RATINGS.csv file together with the trial row.
+"""
+import numpy as np
+
+# session: 0, or n after the n-th resume (checkpoint.py); onsetT starts again at 0 in every session
+traceHeader = 'blockType,blockCounter,label,rating,RT,session,onsetT,frames,frameTs,positions\n'
+
+
+class RatingTrace:
+
+    def __init__(self, frate, maxSeconds=60):
+        self.times = np.full(int(frate * maxSeconds), np.nan)       # flip times
+        self.positions = np.full(int(frate * maxSeconds), np.nan)   # marker position at each flip (scale units)
+        self.n = 0  # frames of the current rating, including any overwritten ones
+
+    def start(self):
+        self.n = 0
+
+    def record(self, flipT, position):
+        i = self.n % len(self.times)
+        self.times[i] = flipT
+        # RatingScale.markerPlacedAt is False (or None) before the marker is placed
+        self.positions[i] = np.nan if position is None or position is False else position
+        self.n += 1
+
+    def samples(self):
+        # (times, positions) of the current rating in recording order
+        size = len(self.times)
+        if self.n <= size:
+            return self.times[:self.n], self.positions[:self.n]
+        order = np.roll(np.arange(size), -(self.n % size))
+        return self.times[order], self.positions[order]
+
+    def row(self, blockType, blockCounter, label, rating, rt, session=0):
+        # one CSV row; frame times relative to the first recorded frame
+        times, positions = self.samples()
+        onsetT = times[0] if len(times) else np.nan
+        return '%s,%s,%s,%s,%s,%i,%.6f,%i,%s,%s\n' % (
+            blockType, blockCounter, label, rating, rt, session, onsetT, self.n,
+            ' '.join('%.4f' % t for t in times - onsetT), ' '.join('%g' % p for p in positions))
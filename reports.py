@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration and rating figures, rendered without a display.
+
+Figures are drawn on matplotlib's Agg canvas (Figure + FigureCanvasAgg, no
+pyplot), so they never open a window and can be drawn from any thread.
+During a session FigureRenderer draws the calibration figure of curveFit()
+on a background thread and saves it next to the _CAL.csv; the experiment
+does not wait for it.
+
+Run this file to (re)generate the figures of every participant in a
+process pool:
+    <data file>_CAL.png       calibration ratings and the fitted curve
+    <data file>_COLORS.png    mean rating of every color in every block type
+
+    python reports.py [data directory] [--out DIR] [--workers N]
+"""
+import argparse
+import glob
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from callog import readCalibration
+from expfit import fitExponential, inverseExponential
+from protocol import colorTrials, baselineTrials
+from trialstore import isTrialCSV, readTrialCSV
+
+# Color of every bcgColor in the figures (PsychoPy rgb is -1..1)
+plotColors = {color['colorName']: [(v + 1) / 2 for v in color['colorRGB']] for color in colorTrials + baselineTrials}
+
+blockOrder = ['baseline', 'baselineExpectation', 'colors', 'expectation', 'intensity']
+
+
+def calFigurePath(calPath):
+    return calPath[:-len('.csv')] + '.png'
+
+def colorsFigurePath(csvPath):
+    return csvPath[:-len('.csv')] + '_COLORS.png'
+
+def saveFigure(fig, path):
+    FigureCanvasAgg(fig)    # attaches itself to the figure
+    fig.savefig(path, dpi=100)
+    return path
+
+###############################################################################
+# %% Figures
+###############################################################################
+
+def calibrationFigure(x, y, a, b, estimationVAS50, title=''):
+    # calibration ratings, fitted curve and the intensity for VAS 50
+    x_fitted = np.linspace(np.min(x), np.max(x), 100)
+    y_fitted = a * np.exp(b * x_fitted)
+
+    fig = Figure(figsize=(6.4, 4.8))
+    ax = fig.add_subplot()
+    ax.scatter(x, y, label='Raw data')
+    ax.plot(x_fitted, y_fitted, 'k', label='Fitted curve')
+    ax.set_title(title)
+    ax.set_ylabel('VAS rating')
+    ax.set_ylim(0, 100)
+    ax.set_xlabel('intensity [mA]')
+    ax.legend()
+
+    #mark point in graph
+    ax.axhline(50, ls="--", color="grey")
+    ax.axvline(estimationVAS50, ls="--", color="grey")
+    ax.plot(estimationVAS50, 50, c="tab:orange", marker="o", markersize=15, alpha=0.5)
+    return fig
+
+def colorsFigure(trials, title=''):
+    # mean rating (+- SD) of every color, grouped by block type; trials as in trialstore.py
+    rated = trials[~np.isnan(trials['VAS'])]
+    blockTypes = [blockType for blockType in blockOrder if np.any(rated['blockType'] == blockType)]
+    blockTypes += sorted(set(rated['blockType']) - set(blockTypes))
+
+    fig = Figure(figsize=(9, 4.8))
+    ax = fig.add_subplot()
+    ticks = []
+    left = 0
+    for blockType in blockTypes:
+        block = rated[rated['blockType'] == blockType]
+        colors = [name for name in plotColors if np.any(block['bcgColor'] == name)]
+        for i, name in enumerate(colors):
+            values = block['VAS'][block['bcgColor'] == name]
+            ax.bar(left + i, values.mean(), yerr=values.std(), color=plotColors.get(name), edgecolor='black', capsize=2)
+        ticks.append(left + (len(colors) - 1) / 2)
+        left += len(colors) + 1
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(blockTypes, rotation=20, ha='right')
+    ax.set_title(title)
+    ax.set_ylabel('VAS rating (mean, SD)')
+    ax.set_ylim(0, 100)
+    fig.tight_layout()
+    return fig
+
+###############################################################################
+# %% Rendering during a session
+###############################################################################
+
+class FigureRenderer:
+    """Draws and saves figures from a background thread."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name='FigureRenderer', daemon=True)
+        self.thread.start()
+
+    def submit(self, path, makeFigure, *args):
+        # called from the experiment thread; the arguments must not change afterwards (pass copies)
+        self.queue.put((path, makeFigure, args))
+
+    def close(self):
+        # waits for the figures already submitted
+        self.queue.put(None)
+        self.thread.join()
+
+    # Renderer thread
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            path, makeFigure, args = job
+            try:
+                saveFigure(makeFigure(*args), path)
+            except Exception as error:     # a figure is never worth stopping the session
+                print('Figure %s not saved: %r' % (path, error))
+
+###############################################################################
+# %% Batch reports (worker processes)
+###############################################################################
+
+def reportParticipant(job):
+    # figures of one participant; returns the paths written
+    csvPath, outDir = job
+    subID = os.path.basename(csvPath).split('_')[0]
+    written = []
+
+    calPath = csvPath[:-len('.csv')] + '_CAL.csv'
+    if os.path.exists(calPath):
+        x, y, estimates = readCalibration(calPath)
+        if len(x) >= 2:
+            try:
+                a, b = fitExponential(x, y)
+            except (RuntimeError, ValueError):
+                print('Calibration fit failed for', calPath)
+            else:
+                estimationVAS50 = estimates.get(50, inverseExponential(50, a, b))
+                fig = calibrationFigure(x, y, a, b, estimationVAS50, subID)
+                written.append(saveFigure(fig, calFigurePath(os.path.join(outDir, os.path.basename(calPath)))))
+
+    trials = readTrialCSV(csvPath)
+    if np.any(~np.isnan(trials['VAS'])):
+        written.append(saveFigure(colorsFigure(trials, subID), colorsFigurePath(os.path.join(outDir, os.path.basename(csvPath)))))
+    return written
+
+def reportDirectory(dataDir, outDir=None, workers=None):
+    outDir = outDir or dataDir
+    os.makedirs(outDir, exist_ok=True)
+    jobs = [(csvPath, outDir) for csvPath in sorted(glob.glob(os.path.join(dataDir, '*.csv'))) if isTrialCSV(csvPath)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        nrFigures = sum(len(written) for written in pool.map(reportParticipant, jobs))
+    print('%i participants, %i figures saved in %s' % (len(jobs), nrFigures, outDir))
+    return nrFigures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dataDir', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'K5_data'))
+    parser.add_argument('--out', default=None, help='output folder (default: the data folder)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    reportDirectory(args.dataDir, args.out, args.workers)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Trial schedule of a whole session, compiled ahead of time from a seed.
+
+Schedule(seed) draws the color order of every block with its own random
+generator (nothing shuffles the shared color lists in protocol.py any more),
+so the order is reproducible from the seed saved in _SCHEDULE.csv. With
+noRepeats, the first color of a block is never the last color of the previous
+color block. Every trial is a record of scheduleDtype: marker code, RGB and
+presentation time; the block loops only iterate over these records.
+"""
+import numpy as np
+
+from protocol import (intBlockNr, expectBlockNr, colorBlockNr, baseBlockNr, intWait, expectWait, calWait,
+                      colorOnlyWait, colorTrials, baselineTrials, baseMarker, baseExpectMarker,
+                      colorsOnlyMarker, expectationMarker, painMarker)
+
+scheduleDtype = np.dtype([
+    ('blockType', 'U20'),
+    ('blockCounter', 'i2'),
+    ('trial', 'i2'),
+    ('bcgColor', 'U8'),
+    ('marker', 'U2'),       # marker code as sent to Biopac
+    ('rgb', 'f4', (3,)),
+    ('colorWait', 'f4'),    # color presentation time in s
+])
+
+# Blocks in session order: (blockType, number of blocks, trial list, marker, colorWait)
+    # marker = fixed code (str) or base added to the color marker (int)
+blockPlan = [
+    ('baseline', baseBlockNr, baselineTrials, baseMarker, intWait),
+    ('baselineExpectation', expectBlockNr, baselineTrials, baseExpectMarker, expectWait),
+    ('colors', colorBlockNr, colorTrials, colorsOnlyMarker, colorOnlyWait),
+    ('expectation', expectBlockNr, colorTrials, expectationMarker, expectWait),
+    ('intensity', intBlockNr, colorTrials, painMarker, intWait),
+]
+
+# Time estimates for the parts that depend on the participant
+trainTime = 0.6     # pulse train in the pain trials
+pauseTime = 2 + 60 + 5 + 45     # fixed waits in runParticipant()
+
+
+class Schedule:
+
+    def __init__(self, seed, noRepeats=True):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        records = []
+        lastColor = None    # last color of the previous block with more than one color
+        for blockType, nrBlocks, trialList, marker, colorWait in blockPlan:
+            for blockCounter in range(1, nrBlocks + 1):
+                order = rng.permutation(len(trialList))
+                if len(trialList) > 1:
+                    while noRepeats and trialList[order[0]]['colorName'] == lastColor:
+                        order = rng.permutation(len(trialList))
+                    lastColor = trialList[order[-1]]['colorName']
+                for trial, i in enumerate(order, 1):
+                    color = trialList[i]
+                    code = marker if isinstance(marker, str) else str(marker + color['colorMarker'])
+                    records.append((blockType, blockCounter, trial, color['colorName'], code, color['colorRGB'], colorWait))
+        self.trials = np.array(records, dtype=scheduleDtype)
+
+    def blocks(self, blockType):
+        # (blockCounter, trials) of every block of this type
+        trials = self.trials[self.trials['blockType'] == blockType]
+        for blockCounter in np.unique(trials['blockCounter']):
+            yield int(blockCounter), trials[trials['blockCounter'] == blockCounter]
+
+    def estimateDuration(self, ratingTime=4.0, calSteps=32):
+        # expected session length in s; ratingTime = mean time to give a rating,
+        # calSteps = stimuli in both calibration series (median of the adaptive procedure)
+        blockType, colorWait = self.trials['blockType'], self.trials['colorWait'].astype(float)
+        pain = np.isin(blockType, ['baseline', 'intensity'])
+        rated = blockType != 'colors'
+        trials = colorWait.sum() + (pain * (trainTime + colorWait)).sum() + rated.sum() * ratingTime
+        calibration = calSteps * (calWait + 0.2 + trainTime + ratingTime)
+        return trials + calibration + pauseTime
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf8') as scheduleFile:
+            scheduleFile.write('seed,blockType,blockCounter,trial,bcgColor,marker,colorWait\n')
+            for trial in self.trials:
+                scheduleFile.write('%i,%s,%i,%i,%s,%s,%g\n' % (self.seed, trial['blockType'], trial['blockCounter'], trial['trial'],
+                                                              trial['bcgColor'], trial['marker'], trial['colorWait']))
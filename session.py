@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Session engine: window, devices and stimuli kept open across participants.
+
+A Session is created once per process. It probes the devices in the
+background right away; open() waits for them and creates the window and
+the stimuli. startParticipant() / endParticipant() only create and close the
+participant's data files and reset the per-participant state, so
+back-to-back participants do not re-create the window, re-open COM4,
+re-discover the LabJack or rebuild the stimuli.
+"""
+import os
+import random
+import time
+
+import serial
+from psychopy import visual, core, event
+from psychopy.hardware import keyboard
+from ds8r import DS8R # Import library to control Digitimer (electrical stimulation)
+
+import checkpoint
+from biopacmarkers import MarkerDispatcher
+from calprior import CalibrationPrior
+from callog import calHeader, readRows
+from datawriter import TrialWriter, recoverJournals
+from frametiming import FrameRecorder
+from labjackio import TriggerOutput
+from protocol import expName, calCeiling
+from ratingscreen import RatingScreen
+from ratingtrace import traceHeader
+from reports import FigureRenderer
+from schedule import Schedule
+from startup import StageTimer, cachedFrameRate
+from stimulation import StimulationScheduler
+from stimuli import Stimuli
+from telemetry import TelemetryPublisher, defaultPort
+from trialstore import checkText, createStore, csvHeader, readTrialCSV
+
+###############################################################################
+# %% Hardware setup (Labjack + Biopac)
+###############################################################################
+
+# Labjack setup
+# Check if labjack library is installed
+try:
+    from psychopy.hardware.labjacks import u3
+    print('Labjack library imported.')
+except:
+    print('No Labjack library found.')
+
+# Check if labjack is connected and recognized by the u3 library
+# The trigger lines (EIO) are written with one feedback transaction per pulse (labjackio.py)
+def setupLabJack():
+    try:
+        trigger = TriggerOutput(u3.U3())
+        trigger.setup() #set EIO as output, start low
+        return trigger, True
+    except Exception as error:
+        print('No Labjack device connected (%r). Switching to test mode.' % error)
+        return None, False
+
+# Biopac EDA setup and start-up
+def setupSerial():
+    ser = serial.Serial('COM4', 115200, timeout=0) #address the serial port
+    ser.flush() # clear
+    ser.write(str.encode('00')) # set marker to '00' at start
+    time.sleep(0.001)
+    ser.write(str.encode('00')) # double-check setting
+    return ser
+
+###############################################################################
+# %% Session
+###############################################################################
+
+# Window settings
+winSize = [2560, 1440]  #2560, 1440 1280, 720
+winScreen = 0
+winMonitor = 'testMonitor'
+backgroundMode = 'clear'    # trial background: 'clear' (window clear color) or 'grating' (full-window GratingStim)
+ratingIdleFrames = None     # stop flipping the rating screen after this many frames without mouse movement (None = never)
+
+# Trial rows are queued and written by a background thread
+    # flushPolicy = when data files are flushed to disk: 'trial', 'block' or 'pause'
+    # rows are journaled on the local disk right away, whatever the policy
+flushPolicy = 'block'
+
+# Live telemetry of trials, markers and phases for the control-room monitor (UDP, python telemetry.py)
+telemetryAddress = ('127.0.0.1', defaultPort)   # None = off
+
+
+class Session:
+
+    def __init__(self, dataDir, simulate=False):
+        self.dataDir = dataDir
+        self.simulate = simulate
+        os.makedirs(dataDir, exist_ok=True)
+
+        # Startup stages are timed; the devices are probed in background threads while the dialog is open
+        self.startupTimer = StageTimer()
+        self.labjackProbe = self.startupTimer.background('LabJack discovery', setupLabJack)
+        self.serialProbe = self.startupTimer.background('serial port', setupSerial)
+
+        # Rows left in the journal by a crashed session are appended to their files first
+        nrRecovered = recoverJournals()
+        if nrRecovered:
+            print('Recovered %i rows from an interrupted session.' % nrRecovered)
+        self.dataWriter = TrialWriter(flushPolicy=flushPolicy)
+        self.telemetry = TelemetryPublisher(telemetryAddress)
+        # Calibration figures are drawn and saved off the experiment thread
+        self.figures = FigureRenderer()
+
+        self.win = None
+        self.participantActive = False
+        self.lastParticipantEnd = None
+
+    def open(self):
+        # wait for the devices and create the window and stimuli; only the first call does anything
+        if self.win is not None:
+            return
+        timer = self.startupTimer
+
+        # Devices probed while the dialog was open
+        with timer.stage('wait for devices'):
+            self.trigger, self.labjack = self.labjackProbe.result()
+            self.ser = self.serialProbe.result()
+
+        # Setup the Window
+        with timer.stage('window'):
+            self.win = visual.Window(
+                size=winSize, fullscr=False, screen=winScreen,
+                winType='pyglet', allowGUI=False, monitor=winMonitor,
+                color= 'black', colorSpace='rgb', units='norm')
+
+        # Frame rate of the monitor, measured once per monitor configuration and cached
+        frameRateKey = '%s_%ix%i_screen%i' % (winMonitor, winSize[0], winSize[1], winScreen)
+        frameRateCache = None if self.simulate else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frameRateCache.json')    # delete the file to measure again
+        with timer.stage('frame rate'):
+            self.frate = round(cachedFrameRate(self.win, frameRateKey, frameRateCache), 0)
+
+        # Biopac markers are written from a background thread; sendOnFlip() ties a marker to the next flip
+        self.markers = MarkerDispatcher(self.ser, self.win, self.telemetry)
+
+        # Set up keyboard
+        self.kb = keyboard.Keyboard()
+        # Hide mouse
+        self.mimo = event.Mouse(visible=False, newPos=None, win=self.win)
+
+        # Set parameters for electrical stimulation
+            # demand = instensity of the stimulus (1 = 0.1mA) -> limited to 150
+            # pulse_width =  shock duration in microseconds
+        self.electricShock = DS8R(demand=10, pulse_width=200, enabled=1, dwell=1, mode=1, polarity=1, source=1, recovery=100)
+        # Pulse trains are delivered from a separate thread, so the window keeps flipping
+        self.stimulator = StimulationScheduler(self.electricShock, self.trigger, self.labjack)
+
+        # Thresholds and fits of past participants, for the start intensity of calibration (calprior.py)
+        calPriorPath = ':memory:' if self.simulate else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calPrior.sqlite')
+        self.calPrior = CalibrationPrior(calPriorPath)
+
+        with timer.stage('stimuli'):
+            self.stimuli = Stimuli(self.win, backgroundMode)
+        # Rating screens draw their static part from a cached layer (ratingscreen.py)
+        self.ratingScreen = RatingScreen(self.win, self.mimo, self.frate, idleFrames=ratingIdleFrames)
+
+        # add the abort key as a background event; psychopy will constantly check it
+        event.globalKeys.add(key='q', func=self.abort, name='shutdown')
+
+    def startParticipant(self, subID, group, expDate, seed=None, resume=False):
+        # resume = continue from the participant's last checkpoint, if there is one (checkpoint.py)
+        self.filenameCheckpoint = checkpoint.checkpointPath(self.dataDir, subID)
+        state = checkpoint.load(self.filenameCheckpoint) if resume else None
+        if resume and state is None:
+            print('No checkpoint to resume for %s: starting a new session.' % subID)
+        if state is not None:
+            group, expDate, seed = state['group'], state['expDate'], state['seed']
+        checkText(subID=subID, group=group)    # before any file is created, not at the first trial
+        self.subID = subID
+        self.group = group
+        self.expDate = expDate
+
+        # Data file name stem = absolute path + name; later add .psyexp, .csv, .log, etc
+        stem = os.path.join(self.dataDir, u'%s_%s_%s_%s' % (subID, group, expName, expDate))
+        # logs saved at the end of a resumed session do not overwrite the ones of the interrupted part
+        logStem = stem if state is None else stem + '_RESUME%i' % (state['resumes'] + 1)
+
+        # File for data from main task
+        self.filename = stem + '.csv' # create 'comma-separated-values' file
+        # Same trials as fixed-size binary records, read with a memory map (trialstore.py)
+        self.filenameTrials = stem + '.trials'
+        # File for data from calibration
+        self.filenameCal = stem + '_CAL.csv'
+        # File for the response time and slider trajectory of every rating (ratingtrace.py)
+        self.filenameRatings = stem + '_RATINGS.csv'
+
+        if state is None:   # a resumed session appends to the files of the interrupted one
+            dataFile = open(self.filename, 'w')     # open file for writing
+            dataFile.write(csvHeader)    # name columns
+            dataFile.close()
+
+            createStore(self.filenameTrials)
+
+            dataFileCal = open(self.filenameCal, 'w')
+            dataFileCal.write(calHeader)    # one row per stimulus (callog.py)
+            dataFileCal.close()
+
+            with open(self.filenameRatings, 'w', encoding='utf8') as ratingsFile:
+                ratingsFile.write(traceHeader)
+
+        # File for the marker log (host timestamps of every Biopac marker)
+        self.filenameMarkers = logStem + '_MARKERS.csv'
+
+        # File for the pulse log (host timestamps of every delivered pulse)
+        self.filenamePulses = logStem + '_PULSES.csv'
+
+        # Files for the frame timing report (per trial and per block)
+        self.filenameFrames = logStem + '_FRAMES.csv'
+        self.filenameFramesBlocks = logStem + '_FRAMES_BLOCKS.csv'
+
+        # Calibration and baseline state of this participant
+        self.stimIntTotal = []    # all stimulus intensities from calibration
+        self.stimVASTotal = []    # all stimulus ratings from calibration
+        self.calSeries = 0    # number of the current calibration series
+        self.calSteps = None    # (intensity, rating or None) of every step of the current series; None between series
+        self.estimationVAS40 = self.estimationVAS50 = self.estimationVAS60 = None
+        self.estimationVAS = None   # intensity used in the pain blocks
+        self.baselineRatings = []   # ratings from the baseline
+        self.baselineMean = None    # mean of the first baseline block
+        self.calThresholds = []     # first rated intensity of every calibration series
+
+        # Progress, saved in the checkpoint after every trial and phase
+        self.completed = []     # phases of runParticipant() done
+        self.phase = None       # current phase
+        self.trialsDone = 0     # trials done in the current phase
+        self.resumes = 0
+        self.finished = False
+        self.trialRows = 0      # rows written to the trial file
+        self.calRows = 0        # rows written to the calibration file
+
+        # Calibration starts below the thresholds of nearly all past participants
+        self.calStart, nPrior = self.calPrior.safeStart(calCeiling)
+
+        if state is not None:
+            for field in checkpoint.stateFields:
+                setattr(self, field, state[field])
+            self.resumes += 1
+            nrRecovered = self.recoverTrials()
+            print('Resuming %s: %i phases done, %i trials of %s (%i recovered after the checkpoint)'
+                  % (subID, len(self.completed), self.trialsDone, self.phase, nrRecovered))
+        else:
+            skipped = 'intensities 1-%i skipped' % (self.calStart - 1) if self.calStart > 1 else 'nothing skipped'
+            print('Calibration start intensity %i, %s (%i participants in the prior)' % (self.calStart, skipped, nPrior))
+
+        # Color order of every block, compiled from a seed saved with the schedule
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**31)
+        self.seed = seed
+        self.schedule = Schedule(seed)
+        if state is None:
+            self.schedule.save(stem + '_SCHEDULE.csv')
+        print('Schedule seed %i, estimated duration %.0f min' % (seed, self.schedule.estimateDuration() / 60))
+
+        # Flip times of every trial, checked for dropped frames against frate
+        self.frameTimer = FrameRecorder(self.frate)
+        self.markers.log.clear()
+        self.stimulator.log.clear()
+
+        if self.lastParticipantEnd is None:
+            self.startupTimer.report(logStem + '_STARTUP.csv')
+        else:
+            print('Changeover from the previous participant: %.1f s' % (time.perf_counter() - self.lastParticipantEnd))
+        self.participantActive = True
+        self.telemetry.publish('participant', subID=subID, group=group, state='start', seed=seed, calStart=self.calStart)
+
+    def endParticipant(self):
+        if not self.participantActive:
+            return
+        self.participantActive = False
+        self.markers.send('00')
+        self.markers.drain()
+        self.markers.saveLog(self.filenameMarkers)
+        self.stimulator.saveLog(self.filenamePulses)
+        if self.labjack:
+            print('LabJack transactions: n = %i, median %.3f ms, p95 %.3f ms, max %.3f ms' % self.trigger.latencySummary())
+            self.trigger.latencies.clear()
+        self.frameTimer.saveReport(self.filenameFrames, self.filenameFramesBlocks)
+        self.dataWriter.sync('pause')
+        self.telemetry.publish('participant', subID=self.subID, group=self.group, state='end')
+        self.lastParticipantEnd = time.perf_counter()
+
+    # Progress of runParticipant(), checkpointed (checkpoint.py)
+    def isDone(self, phase):
+        return phase in self.completed
+
+    def startPhase(self, phase):
+        # trialsDone is kept when this is the phase of a resumed checkpoint, or when the
+        # checkpoint was between phases and the first trials of this one were recovered
+        if self.phase is not None and phase != self.phase:
+            self.trialsDone = 0
+        self.phase = phase
+
+    def trialDone(self):
+        self.trialsDone += 1
+        self.checkpoint()
+
+    def phaseDone(self, phase):
+        self.completed.append(phase)
+        self.phase = None
+        self.trialsDone = 0
+        self.checkpoint()
+
+    def checkpoint(self):
+        # encoded here, written by the writer thread after the rows of this trial
+        self.dataWriter.replace(self.filenameCheckpoint, checkpoint.encode(self))
+
+    def writeRows(self, *rows):
+        # (path, row) pairs of one trial, journaled together; rows of the trial and calibration files are counted
+        self.dataWriter.writeRows(rows)
+        self.trialRows += sum(path == self.filename for path, row in rows)
+        self.calRows += sum(path == self.filenameCal for path, row in rows)
+
+    def recoverTrials(self):
+        # trials written after the resumed checkpoint (hard crash): done, not run again; returns their number
+        nrRecovered = 0
+        for trial in readTrialCSV(self.filename)[self.trialRows:]:
+            self.trialRows += 1
+            self.trialsDone += 1
+            nrRecovered += 1
+            if trial['blockType'] == 'baseline':
+                self.baselineRatings.append(float(trial['VAS']))
+        for fields in readRows(self.filenameCal)[self.calRows:]:
+            self.calRows += 1
+            if fields[0] == 'start':    # series started
+                self.calSeries, self.calSteps = int(fields[1]), []
+            elif fields[0].isdigit():   # calibration step
+                self.calSteps.append([int(fields[2]), float(fields[3]) if fields[3] else None])
+                self.trialsDone += 1
+                nrRecovered += 1
+            elif fields[0] == 'estimate':   # the curve fit was done
+                setattr(self, 'estimationVAS%s' % fields[1], float(fields[2]))
+                if 'curveFit' not in self.completed:
+                    self.completed.append('curveFit')
+        return nrRecovered
+
+    def close(self):
+        self.telemetry.close()
+        self.figures.close()
+        if self.win is None:    # no participant was run; the serial port may not have opened
+            if self.serialProbe.exception() is None:
+                self.serialProbe.result().close()
+        else:
+            self.markers.close()
+            self.stimulator.close()
+            self.calPrior.close()
+            self.ser.close()
+            event.globalKeys.remove(key='q')
+            self.win.close()
+        self.dataWriter.close()     # last: raises if the data files could not be written
+
+    # how to abort the experiment ('q')
+    def abort(self):
+        self.endParticipant()
+        self.close()
+        core.quit()
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Headless simulation backend.
+
+install() registers fake psychopy, serial, ds8r and LabJack modules in
+sys.modules, so the unchanged experiment code runs against:
+- a virtual clock (core.wait and win.flip advance it instantly),
+- a window that draws nothing and flips at a fixed frame rate,
+- a serial port, DS8R stimulator and LabJack U3 that record every write,
+- a synthetic participant (participantmodel.py) answering the dialog, key
+  presses and rating scales.
+
+Run the whole protocol headless with:
+    python ColorsPainExpectations.py --simulate [--seed N] [--group congruent|incongruent|color-ctrl] [--participants N] [--resume]
+"""
+import sys
+import threading
+import types
+from collections import namedtuple
+
+import numpy as np
+
+from participantmodel import SyntheticParticipant
+
+###############################################################################
+# %% Virtual clock and simulated participant
+###############################################################################
+
+class VirtualClock:
+
+    def __init__(self, frate=60):
+        self.t = 0.0
+        self.framePeriod = 1 / frate
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.t
+
+    def advance(self, seconds):
+        with self.lock:
+            self.t += max(seconds, 0)
+
+    def nextFrame(self):
+        # move to the next frame boundary and return its time
+        with self.lock:
+            self.t = (np.floor(self.t / self.framePeriod + 1e-9) + 1) * self.framePeriod
+            return self.t
+
+
+class SimulatedSubject:
+    """Wraps a SyntheticParticipant with the state the experiment screens need."""
+
+    def __init__(self, participant, rng, group='congruent'):
+        self.participant = participant
+        self.rng = rng
+        self.group = group
+        self.pendingStim = None     # intensity of the last series not rated yet
+        self.lastStim = None
+        self.painRatings = []
+
+    def stimulate(self, intensity):
+        self.pendingStim = self.lastStim = intensity
+
+    def feltLast(self):
+        return self.lastStim is not None and self.participant.feels(self.lastStim)
+
+    def rate(self):
+        # pain rating after a series, expectation otherwise (0 before any pain, as in the practice)
+        if self.pendingStim is not None:
+            rating = self.participant.rate(self.pendingStim) if self.participant.feels(self.pendingStim) else 0
+            self.pendingStim = None
+            self.painRatings.append(rating)
+            return rating
+        if not self.painRatings:
+            return 0
+        return int(np.clip(round(np.mean(self.painRatings) + self.rng.normal(0, 10)), 0, 100))
+
+    def responseTime(self):
+        return self.rng.gamma(4, 0.4)   # about 1.6 s
+
+clock = VirtualClock()
+subject = None
+
+###############################################################################
+# %% Fake psychopy
+###############################################################################
+
+class Stim:
+    # any drawable stimulus; keeps its keyword arguments as attributes
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        pass
+
+    def setColor(self, color, colorSpace=None):
+        self.color = color
+
+
+class Window:
+
+    def __init__(self, size=(2560, 1440), color='black', **kwargs):
+        self.size = size
+        self.color = color
+        self.frameRate = 1 / clock.framePeriod
+        self.lastFrameT = clock.now()
+        self._toCall = []
+        self.nFlips = 0
+
+    def flip(self, clearBuffer=True):
+        self.lastFrameT = clock.nextFrame()
+        self.nFlips += 1
+        toCall, self._toCall = self._toCall, []
+        for function, args, kwargs in toCall:
+            function(*args, **kwargs)
+        return self.lastFrameT
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self._toCall.append((function, args, kwargs))
+
+    def getActualFrameRate(self, **kwargs):
+        return self.frameRate
+
+    def clearBuffer(self, color=True, depth=False, stencil=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class RatingScale(Stim):
+    """Rating scale answered by the simulated subject after a response time."""
+
+    def __init__(self, win=None, markerStart=None, **kwargs):
+        super().__init__(win, markerStart=markerStart, **kwargs)
+        self.reset()
+
+    def reset(self):
+        self.noResponse = True
+        self.startT = None
+        self.rating = None
+        self.rt = None
+        self.markerPlacedAt = self.markerStart
+
+    def draw(self, win=None):
+        if not self.noResponse:
+            return
+        if self.startT is None:
+            self.startT = clock.now()
+            self.rt = subject.responseTime()
+            self.rating = subject.rate()
+        elapsed = clock.now() - self.startT
+        if elapsed >= self.rt:
+            self.markerPlacedAt = self.rating
+            self.noResponse = False
+        elif self.markerStart is not None:
+            self.markerPlacedAt = self.markerStart + (self.rating - self.markerStart) * elapsed / self.rt
+
+    def getRating(self):
+        return self.rating
+
+    def getRT(self):
+        return self.rt
+
+
+class Mouse:
+
+    def __init__(self, visible=True, newPos=None, win=None):
+        self.visible = visible
+        self.pos = np.zeros(2)
+
+    def getPos(self):
+        return self.pos
+
+    def setVisible(self, visible):
+        self.visible = visible
+
+    def getPressed(self, getTime=False):
+        return [0, 0, 0]
+
+    def mouseMoved(self, distance=None, reset=False):
+        return False
+
+
+class GlobalKeys:
+
+    def __init__(self):
+        self.keys = {}
+
+    def add(self, key, func, name=None, **kwargs):
+        self.keys[key] = func
+
+    def remove(self, key, modifiers=(), name=None):
+        self.keys.pop(key, None)
+
+
+class Dialog:
+    """Participant dialog; a new synthetic participant every time, cancelled after simParticipants."""
+
+    def __init__(self, dictionary, title='', **kwargs):
+        global subject, nrParticipants
+        self.OK = nrParticipants < simParticipants
+        if not self.OK:
+            return
+        if nrParticipants > 0:  # install() created the first one
+            rng = np.random.default_rng(simSeed + nrParticipants)
+            subject = SimulatedSubject(SyntheticParticipant.random(rng), rng, subject.group)
+        self.data = ['sim%04i' % (simSeed + nrParticipants), subject.group, simResume]
+        dictionary.update(ID=self.data[0], Group=self.data[1], Resume=self.data[2])
+        nrParticipants += 1
+
+
+def wait(secs, hogCPUperiod=0.2):
+    # only the experiment thread moves the virtual clock; waits in background
+    # threads (stimulation.py) return at once, their timing is not simulated
+    if threading.current_thread() is threading.main_thread():
+        clock.advance(secs)
+
+def waitKeys(maxWait=float('inf'), keyList=None, **kwargs):
+    clock.advance(subject.responseTime())
+    if keyList and 'a' in keyList and 'apostrophe' in keyList:     # "did you feel it?"
+        return ['a' if subject.feltLast() else 'apostrophe']
+    return [keyList[0] if keyList else 'return']
+
+def quit():
+    sys.exit(0)
+
+def getDateStr(format='%Y-%m-%d_%Hh%M.%S.%f'):
+    return 'sim'
+
+###############################################################################
+# %% Fake devices
+###############################################################################
+
+class Serial:
+    """Serial port that records (time, bytes) of every write."""
+
+    def __init__(self, port=None, baudrate=9600, timeout=None, **kwargs):
+        self.port = port
+        self.writes = []
+        self.is_open = True
+
+    def write(self, data):
+        self.writes.append((clock.now(), bytes(data)))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class DS8R:
+    """DS8R stimulator; run() delivers a series at the current demand to the subject."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+        self.pulses = []
+
+    def run(self):
+        self.pulses.append((clock.now(), self.demand))
+        subject.stimulate(self.demand / 10)
+
+
+# Feedback commands of the u3 library, with the same fields
+PortDirWrite = namedtuple('PortDirWrite', 'Direction WriteMask')
+PortStateWrite = namedtuple('PortStateWrite', 'State WriteMask')
+WaitShort = namedtuple('WaitShort', 'Time')
+
+
+class U3:
+    """LabJack U3 that records (time, register, value) of every register write
+    and (time, commands) of every feedback transaction."""
+
+    def __init__(self, *args, **kwargs):
+        self.writes = []
+        self.transactions = []
+
+    def writeRegister(self, addr, value):
+        self.writes.append((clock.now(), addr, value))
+        return value
+
+    def getFeedback(self, *commands):
+        # like the u3 library, only its own feedback commands are accepted
+        for command in commands:
+            if not isinstance(command, (PortDirWrite, PortStateWrite, WaitShort)):
+                raise TypeError('%r is not a u3 feedback command' % (command,))
+        self.transactions.append((clock.now(), commands))
+        return [None] * len(commands)
+
+    def close(self):
+        pass
+
+###############################################################################
+# %% Installation
+###############################################################################
+
+simSeed = 0
+simParticipants = 1    # participants run back to back in one session
+simResume = False   # resume the participants from their checkpoints
+nrParticipants = 0
+
+def module(name, **attributes):
+    fake = types.ModuleType(name)
+    fake.__dict__.update(attributes)
+    return fake
+
+def parseArgs(argv):
+    # --seed N, --group NAME, --participants N and --resume options of the simulation mode
+    options = {'seed': 0, 'group': 'congruent', 'participants': 1}
+    for key in options:
+        if '--' + key in argv:
+            value = argv[argv.index('--' + key) + 1]
+            options[key] = value if key == 'group' else int(value)
+    options['resume'] = '--resume' in argv
+    return options
+
+def install(seed=0, group='congruent', participants=1, resume=False, frate=60):
+    global subject, simSeed, simParticipants, simResume, clock
+    simSeed = seed
+    simParticipants = participants
+    simResume = resume
+    rng = np.random.default_rng(seed)
+    subject = SimulatedSubject(SyntheticParticipant.random(rng), rng, group)
+    clock = VirtualClock(frate)
+
+    visual = module('psychopy.visual', Window=Window, TextStim=Stim, GratingStim=Stim, ImageStim=Stim,
+                    BufferImageStim=Stim, Rect=Stim, RatingScale=RatingScale)
+    core = module('psychopy.core', wait=wait, getTime=clock.now, quit=quit)
+    event = module('psychopy.event', waitKeys=waitKeys, Mouse=Mouse, globalKeys=GlobalKeys())
+    gui = module('psychopy.gui', DlgFromDict=Dialog)
+    data = module('psychopy.data', getDateStr=getDateStr)
+    keyboard = module('psychopy.hardware.keyboard', Keyboard=Stim)
+    # psychopy.hardware.labjacks is a module, u3 one of its attributes (not a submodule)
+    u3 = module('u3', U3=U3, PortDirWrite=PortDirWrite, PortStateWrite=PortStateWrite, WaitShort=WaitShort)
+    labjacks = module('psychopy.hardware.labjacks', u3=u3)
+    hardware = module('psychopy.hardware', keyboard=keyboard, labjacks=labjacks)
+    psychopy = module('psychopy', visual=visual, core=core, event=event, gui=gui, data=data, hardware=hardware,
+                      prefs=module('psychopy.prefs'), logging=module('psychopy.logging'), clock=module('psychopy.clock'))
+    psychopy.__path__ = []
+
+    sys.modules.update({
+        'psychopy': psychopy, 'psychopy.visual': visual, 'psychopy.core': core, 'psychopy.event': event,
+        'psychopy.gui': gui, 'psychopy.data': data, 'psychopy.hardware': hardware,
+        'psychopy.hardware.keyboard': keyboard, 'psychopy.hardware.labjacks': labjacks,
+        'serial': module('serial', Serial=Serial),
+        'ds8r': module('ds8r', DS8R=DS8R),
+    })
+    return subject
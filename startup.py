@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Startup helpers: per-stage timing, background device probing and a cache of
+measured frame rates.
+
+Device probing (LabJack discovery, opening the serial port) runs in worker
+threads while the participant dialog is open. Stimuli are still built on the
+main thread after the window exists, because the OpenGL context belongs to
+the thread that created the window.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Records start and end of every startup stage, foreground or background."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages = []    # (name, thread, start, end) in seconds since t0
+        self.running = {}   # start times of the stages in progress
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='startup')
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    # start()/stop() for stages that span module-level code
+    def start(self, name):
+        self.running[name] = time.perf_counter()
+
+    def stop(self, name):
+        self._add(name, self.running.pop(name))
+
+    def background(self, name, func, *args):
+        # run func(*args) in a worker thread; returns a Future
+        def timed():
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._add(name, start)
+        return self.pool.submit(timed)
+
+    def _add(self, name, start):
+        self.stages.append((name, threading.current_thread().name, start - self.t0, time.perf_counter() - self.t0))
+
+    def report(self, path=None):
+        self.pool.shutdown(wait=False)
+        total = time.perf_counter() - self.t0
+        print('Startup: %.2f s' % total)
+        for name, thread, start, end in sorted(self.stages, key=lambda stage: stage[2]):
+            print('  %-30s %-12s start %7.3f s   duration %7.3f s' % (name, thread, start, end - start))
+        if path:
+            with open(path, 'w', encoding='utf8') as reportFile:
+                reportFile.write('stage,thread,start,duration\n')
+                for name, thread, start, end in self.stages:
+                    reportFile.write('%s,%s,%.6f,%.6f\n' % (name, thread, start, end - start))
+                reportFile.write('total,,0,%.6f\n' % total)
+
+
+def cachedFrameRate(win, key, cachePath=None):
+    # measured frame rate of this monitor configuration; measured once and cached by key
+    cache = {}
+    if cachePath and os.path.exists(cachePath):
+        with open(cachePath, encoding='utf8') as cacheFile:
+            cache = json.load(cacheFile)
+    if key in cache:
+        return cache[key]
+
+    frate = win.getActualFrameRate()
+    if cachePath and frate is not None:
+        cache[key] = frate
+        with open(cachePath, 'w', encoding='utf8') as cacheFile:
+            json.dump(cache, cacheFile, indent=1)
+    return frate
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Pulse trains delivered from a dedicated stimulation thread.
+
+start() queues a train and returns at once, so the window keeps flipping
+while the pulses are delivered. The first pulse is DS8R.run(); every further
+pulse is a rising and falling edge on the LabJack trigger lines (one feedback
+transaction, labjackio.py), 'interval' seconds after the previous one. The
+thread sleeps until 1 ms before each pulse, then spins, and runs at raised
+priority where the OS allows it.
+Every pulse is timestamped with core.getTime(), the clock of the marker log.
+"""
+import ctypes
+import queue
+import sys
+import threading
+import time
+
+from psychopy import core
+
+logHeader = 'demand,rep,requestT,pulseTs\n'
+
+spinPeriod = 0.001  # the last part of every wait spins instead of sleeping
+
+
+class PulseTrain:
+    """One queued train; wait() blocks until the last pulse was delivered."""
+
+    def __init__(self, demand, rep, interval):
+        self.demand = demand
+        self.rep = rep
+        self.duration = rep * interval      # including the interval after the last pulse, as before
+        self.requestT = core.getTime()
+        self.pulseTs = []    # core.getTime() of every pulse
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class StimulationScheduler:
+
+    def __init__(self, electricShock, trigger, labjack=True, interval=0.2):
+        self.electricShock = electricShock
+        self.trigger = trigger     # labjackio.TriggerOutput
+        self.labjack = labjack     # without a LabJack (test mode) no pulses are delivered
+        self.interval = interval
+        self.log = []   # every PulseTrain, in order
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='StimulationScheduler', daemon=True)
+        self.thread.start()
+
+    def start(self, demand, rep):
+        # queue a train of rep pulses at demand (1 = 0.1mA); returns the PulseTrain
+        train = PulseTrain(demand, rep, self.interval)
+        self.log.append(train)
+        if self.labjack:
+            self.queue.put(train)
+        else:
+            train.done.set()
+        return train
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def saveLog(self, path):
+        with open(path, 'w', encoding='utf8') as logFile:
+            logFile.write(logHeader)
+            for train in self.log:
+                logFile.write('%i,%i,%.6f,%s\n' % (train.demand, train.rep, train.requestT,
+                                                  ' '.join('%.6f' % t for t in train.pulseTs)))
+
+    # Stimulation thread
+    def _run(self):
+        raisePriority()
+        while True:
+            train = self.queue.get()
+            if train is None:
+                break
+            try:
+                self._deliver(train)
+            finally:
+                train.done.set()
+
+    def _deliver(self, train):
+        self.electricShock.demand = train.demand
+        self.electricShock.run()
+        start = core.getTime()
+        train.pulseTs.append(start)
+        for i in range(1, train.rep):
+            waitUntil(start + i * self.interval)
+            train.pulseTs.append(core.getTime())
+            self.trigger.pulse()
+        waitUntil(start + train.rep * self.interval)
+
+
+def waitUntil(t):
+    # sleep until spinPeriod before t, then spin on the clock of the timestamps; core.wait() only
+    # sleeps with hogCPUperiod=0 (its spin loop pumps window events, which is for the main thread only)
+    remaining = t - core.getTime()
+    if remaining > spinPeriod:
+        core.wait(remaining - spinPeriod, hogCPUperiod=0)
+    spinEnd = time.perf_counter() + spinPeriod     # bound, for a clock that does not move (simulation.py)
+    while core.getTime() < t and time.perf_counter() < spinEnd:
+        pass
+
+def raisePriority():
+    # time-critical thread priority on Windows; elsewhere the default priority is kept
+    if sys.platform == 'win32':
+        try:
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 15)    # THREAD_PRIORITY_TIME_CRITICAL
+        except (AttributeError, OSError):
+            pass
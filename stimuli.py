@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Texts, scales and other visual elements of the experiment.
+
+All stimuli are built once per window and reused for every participant;
+resetColors() undoes the color changes of the block functions before the
+next one.
+"""
+import random
+
+from psychopy import visual
+
+from background import Background
+from ratingscales import RatingScalePool
+
+
+class Stimuli:
+
+    def __init__(self, win, backgroundMode='clear'):
+        # Additional grating for changing background
+        slideGrating = visual.GratingStim(
+                win=win, name='slideColor',units='norm', tex=None, mask=None,
+                ori=0, pos=(0, 0), size=(2,2), sf=None, phase=0.0,color=[-1.000,-1.000,-1.000],
+                colorSpace='rgb', opacity=1, blendmode='avg', texRes=128, interpolate=True, 
+                depth=0.0)
+        # Background color of the trials: window clear color, or the grating (see background.py)
+        self.slideColor = Background(win, slideGrating, mode=backgroundMode)
+
+        # Rating scales
+        self.ratingScale = visual.RatingScale(win, low=0, high=100, labels=['0\n brak bólu', '100\n najsilniejszy ból'], scale=None, tickMarks=[0, 100],
+                                              markerColor='grey', markerStart=random.randint(0, 100), stretch=1.5, showValue=False, 
+                                              acceptPreText='Wybierz ocenę', acceptText='Akceptuj', acceptSize=1.5, skipKeys=None,
+                                              textColor='white', mouseOnly=True)
+
+        self.ratingScaleSample = visual.RatingScale(win, pos=(0, 0.15), low=0, high=100, labels=['0\n brak bólu', '100\n najsilniejszy ból'], scale=None, tickMarks=[0, 100],
+                                              markerColor='grey', stretch=1.5, showValue=False, acceptPreText='Wybierz ocenę',
+                                              acceptText='Akceptuj', acceptSize=1.5, skipKeys=None, textColor='white')
+
+        # Prebuilt trial rating scales (grey/white and black/black), reset before every trial
+        self.scalePool = RatingScalePool(win)
+
+        # Instruction texts
+        self.instructionStart = visual.TextStim(win=win, name='Start instruction',
+            text=
+        '''W badaniu będziesz otrzymywać bodźce elektryczne w seriach. Każda seria będzie składała się z trzech bodźców. 
+
+W czasie aplikacji każdej serii bodźców na ekranie będzie wyświetlał się punkt fiksacji.
+Aby go zobaczyć, wciśnij ENTER.''',
+            font='Arial', pos=(-0.9, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionStart2 = visual.TextStim(win=win, name='Start instruction',
+            text=
+        '''Będziemy prosili, żebyś oceniał_a swoje doznania za pomocą skali, która będzie wyglądała w ten sposób:
+
+    
+
+
+
+
+
+
+
+Aby przejść dalej wciśnij ENTER.    
+''',
+            font='Arial', pos=(-0.9, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionStart3 = visual.TextStim(win=win, name='Start instruction 3',
+            text=
+        '''Gdy na ekranie pojawi się skala, oceń swoje doznania. Pamiętaj, że: 
+
+0 - oznacza brak bólu. Jeżeli dana seria bodźców była odczuwalna, ale nie spowodowała bólu, a jedynie wrażenie dotyku lub nieprzyjemne odczucie, oceń tę serię na 0 przesuwając suwak maksymalnie w lewą stronę
+
+100 - oznacza najsilniejszy ból wywołany elektryczną stymulacją, jaki jesteś w stanie znieść w tej sytuacji eksperymentalnej 
+
+
+Swoje doznania oceniaj możliwie szybko, ustawiając suwak na skali i akceptując swoją ocenę przyciskiem 'Akceptuj'. 
+
+Aby przejść dalej wciśnij ENTER. ''',
+            font='Arial', pos=(-0.9, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionStart4 = visual.TextStim(win=win, name='Start instruction 4',
+            text=
+        '''Za chwilę przejdziemy do pierwszej części badania.
+
+W tej częsci będziesz otrzymywał_a bodźce elektryczne w seriach. Każda seria będzie składała się z trzech bodźców. Nasilenie kolejnych serii będzie stopniowo wzrastało, ale ten wzrost nie będzie gwałtowny. Serie bodźców będą aplikowane co 5 sekund, ale pierwsze bodźce mogą nie być w ogóle odczuwalne.
+
+Aby rozpocząć, wciśnij ENTER.''',
+            font='Arial', pos=(-0.9, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionPractice = visual.TextStim(win=win, name='Practice instruction',
+            text=
+        '''Przećwiczmy teraz korzystanie ze skali do oceny bólu. Zaznacz na skali za pomocą myszki ocenę '0' i zaakceptuj swój wybór.''',
+            font='Arial', pos=(-0.9, 0.3), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionPracticeOnceAgain = visual.TextStim(win=win, name='Try one more time',
+            text=
+        'Wybrałe_aś ocenę powyżej 0. Spróbuj jeszcze raz.',
+            font='Arial', pos=(-0.9, 0.3), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, anchorHoriz = 'left', alignText= 'left')
+
+        self.instructionExpect = visual.TextStim(win=win, name='expectation instruction',
+            text=
+        '''W następnej części badania NIE będziesz otrzymywał_a bodźców bólowych. 
+Tym razem poprosimy Cię o ocenę, jak silnego bólu się spodziewasz. 
+
+
+Aby przejść do zadania, naciśnij ENTER.''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=2, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.instructionInt = visual.TextStim(win=win, name='intensity instruction',
+            text=
+        '''W następnej części badania będziesz otrzymywał_a bodźce bólowe, a w momencie ich aplikacji, tak jak wcześniej, na ekranie będzie wyświetlany punkt fiksacji.
+Twoim zadaniem jest ocenienie na skali, jak silny był ból wywołany aplikowanymi bodźcami. 
+
+
+Aby przejść do zadania, naciśnij ENTER.''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.instructionColors = visual.TextStim(win=win, name='colors only instruction',
+            text=
+        '''W następnej części badania NIE będziesz otrzymywał_a bodźców bólowych. 
+Twoim zadaniem będzie obserwowanie wyświetlanych na ekranie kolorowych slajdów. 
+
+
+Aby przejść do zadania, naciśnij ENTER.''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=2, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.instructionRepeat = visual.TextStim(win=win, name='repeat baseline instruction',
+            text=
+        '''W następnej części badania nadal będziesz otrzymywał_a bodźce bólowe, a w momencie ich aplikacji, tak jak wcześniej, na ekranie będzie wyświetlany punkt fiksacji.
+Twoim zadaniem jest w dalszym ciągu ocenienie na skali, jak silny był ból wywołany aplikowanymi bodźcami. 
+
+
+Aby przejść do zadania, naciśnij ENTER.''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.instructionManipulation1 = visual.TextStim(win=win, name='manipulation instruction, part 1',
+            text=
+        '''W poprzednim etapie badania określiliśmy Twoją wrażliwość na bodźce bólowe wywołane elektryczną stymulacją. Sprawdziliśmy również Twoje reakcje fizjologiczne (tj. tętno oraz reakcję skórno-galwaniczną) w odpowiedzi na prezentację różnych kolorów.
+
+Na podstawie tych pomiarów algorytm komputerowy obliczy teraz Twój wzorzec reakcji bólowej i dopasuje go do modelu stworzonego na podstawie wcześniejszych badań naukowych.
+
+Naciśnij ENTER, aby kontynuować.
+''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, alignText= 'left')
+
+        self.instructionManipulation2 = visual.TextStim(win=win, name='manipulation instruction, part 2',
+            text=
+        '''PRZERWA
+
+Trwa przeliczanie danych...
+''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=2, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.instructionManipulation3Congruent = visual.TextStim(win=win, name='manipulation instruction, part 3 - congruent group',
+            text=
+        '''Na podstawie pomiarów określiliśmy, że Twój wzorzec reakcji bólowej jest zbliżony do osób, u których kolor czerwony zwiększa siłę odczuwanego bólu, a kolor biały zmniejsza ból.
+
+Za chwilę rozpoczniemy następny etap badania. Celem tego etapu jest rozbudowanie istniejącego modelu rekacji bólowych na podstawie uzyskanych danych.
+Twoim zadaniem ponownie będzie ocenianie swoich doznań na skali. Będziemy również w dalszym ciągu rejestrowali Twoje reakcje fizjologiczne.
+
+
+Aby przejść dalej, naciśnij ENTER.
+''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, alignText= 'left')
+
+        self.instructionManipulation3Incongruent = visual.TextStim(win=win, name='manipulation instruction, part 3 - congruent group',
+            text=
+        '''Na podstawie pomiarów określiliśmy, że Twój wzorzec reakcji bólowej jest zbliżony do osób, u których kolor biały zwiększa siłę odczuwanego bólu, a kolor czerwony zmniejsza ból.
+
+Za chwilę rozpoczniemy następny etap badania. Celem tego etapu jest rozbudowanie istniejącego modelu rekacji bólowych.
+Twoim zadaniem ponownie będzie ocenianie swoich doznań na skali. Będziemy również w dalszym ciągu rejestrowali Twoje reakcje fizjologiczne.
+
+
+Aby przejść dalej, naciśnij ENTER.
+''',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.75, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0, alignText= 'left')
+
+        # Fixation cross
+        self.fixCross = visual.TextStim(win=win, name='fixation point',
+            text='+',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        # Rating scale texts
+        self.intRatingScale = visual.TextStim(win=win, name='intensity rating',
+            text='Oceń jak bardzo bolesna była ta seria bodźców',
+            font='Arial', pos=(0, 0.5), height=0.15, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.baseExpectRatingScale = visual.TextStim(win=win, name='intensity rating',
+            text='Oceń jak silnego bólu się spodziewasz',
+            font='Arial', pos=(0, 0.5), height=0.15, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.expectRatingScale = visual.TextStim(win=win, name='expectation rating',
+            text='Oceń jak silnego bólu spodziewasz się po prezentacji tego koloru',
+            font='Arial', pos=(0, 0.5), height=0.15, wrapWidth=1.7, ori=0, color='black', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.noScale = visual.TextStim(win=win, name='no scale',
+            text=' ',
+            font='Arial', pos=(0, 0.5), height=0.15, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.feelSth = visual.TextStim(win=win, name='feel or not',
+            text=
+        '''Czy poczułeś_aś bodziec?
+
+
+TAK/NIE
+''',
+            font='Arial', pos=(0, 0), height=0.1, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        # Break text
+        self.pause = visual.TextStim(win=win, name='break text',
+            text='PRZERWA',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.pauseCalContinue = visual.TextStim(win=win, name='Continue text',
+            text='Za chwilę procedura zostanie powtórzona',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        self.pauseContinue = visual.TextStim(win=win, name='Continue text',
+            text='Za chwilę badanie będzie kontynuowane',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        # End text
+        self.goodbye = visual.TextStim(win=win, name='end text',
+            text='KONIEC',
+            font='Arial', pos=(0, 0), height=0.075, wrapWidth=1.5, ori=0, color='white', 
+            colorSpace='rgb', opacity=1, languageStyle='LTR', depth=-2.0)
+
+        # Initial colors of the stimuli the block functions recolor
+        self.initialColors = {name: getattr(self, name).color for name in recolored}
+
+    def resetColors(self):
+        # every recolored stimulus and the background back to its initial color
+        for name, color in self.initialColors.items():
+            getattr(self, name).setColor(color, colorSpace='rgb')
+        self.slideColor.reset()
+
+
+# Stimuli whose color the block functions change (functions.py)
+recolored = ('fixCross', 'intRatingScale', 'expectRatingScale', 'noScale')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Live telemetry for the control-room monitor.
+
+publish() puts a message on a bounded queue and returns; a sender thread
+encodes it as JSON and sends it as one UDP datagram to the monitor address.
+UDP needs no subscriber: without a viewer (or with a slow one) the
+datagrams are simply lost, and when the queue is full new messages are
+dropped and counted, so the experiment never waits for the monitor.
+
+Messages: participant, phase, trial, marker, estimates. Run this file on the
+monitor machine (or on the same one) to print them as they arrive:
+    python telemetry.py [port]
+"""
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+
+defaultPort = 47800
+
+
+class TelemetryPublisher:
+
+    def __init__(self, address=('127.0.0.1', defaultPort), maxQueue=1000):
+        self.address = address  # None = telemetry off
+        self.dropped = 0
+        self.queue = queue.Queue(maxQueue)
+        if address is None:
+            return
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.thread = threading.Thread(target=self._run, name='Telemetry', daemon=True)
+        self.thread.start()
+
+    def publish(self, kind, **fields):
+        # called from any thread; never blocks
+        if self.address is None:
+            return
+        fields['kind'] = kind
+        fields['t'] = time.time()
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.address is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.sock.close()
+
+    # Sender thread
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.sock.sendto(json.dumps(message, default=float).encode(), self.address)
+            except (OSError, ValueError):
+                pass    # no route, full socket buffer or a message too large: dropped
+
+###############################################################################
+# %% Viewer
+###############################################################################
+
+def formatMessage(message):
+    kind = message.pop('kind')
+    t = time.strftime('%H:%M:%S', time.localtime(message.pop('t')))
+    if kind == 'trial':
+        return '%s  trial   %-20s %3s  %-8s marker %-3s VAS %s' % (
+            t, message['blockType'], message['blockCounter'], message['label'], message['marker'], message['rating'])
+    if kind == 'marker':
+        return '%s  marker  %-3s %s' % (t, message['code'], message['label'])
+    return '%s  %-7s %s' % (t, kind, ', '.join('%s=%s' % item for item in message.items()))
+
+def view(port=defaultPort):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('', port))
+    print('Listening on UDP port %i' % port)
+    while True:
+        data, sender = sock.recvfrom(65536)
+        print(formatMessage(json.loads(data)), flush=True)
+
+
+if __name__ == '__main__':
+    try:
+        view(int(sys.argv[1]) if len(sys.argv) > 1 else defaultPort)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Resume after a hard crash, on the simulation backend.
+
+The experiment runs in a child process on a copy of the repository and exits
+with os._exit() right after the n-th Session.trialDone() or
+Session.writeRows() call, as on a power cut. A second run resumes it
+(--resume); the data files must then hold every trial of the schedule once,
+in order, one rating trace for every rated trial and calibration step, and
+no calibration step twice.
+    python -m pytest tests
+"""
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+from callog import readRows
+from trialstore import csvHeader, openStore, readTrialCSV
+
+# Runs the experiment and exits hard after call number CRASH_AFTER of Session.CRASH_WHERE
+crashRunner = '''
+import os, runpy, sys
+import simulation
+simulation.install(**simulation.parseArgs(sys.argv))
+import session
+where, after = os.environ['CRASH_WHERE'], int(os.environ['CRASH_AFTER'])
+original = getattr(session.Session, where)
+calls = [0]
+def crashing(self, *args):
+    original(self, *args)
+    calls[0] += 1
+    if calls[0] == after:
+        os._exit(1)
+setattr(session.Session, where, crashing)
+simulation.install = lambda **kwargs: None     # installed above
+runpy.run_path('ColorsPainExpectations.py', run_name='__main__')
+'''
+
+# (method, call number), spread over the two calibration series, the curve fit and the trial blocks
+# (a full simulated run has 111 trialDone() and 114 writeRows() calls)
+crashPoints = [('trialDone', 1), ('trialDone', 21), ('writeRows', 42), ('trialDone', 45),
+               ('trialDone', 70), ('writeRows', 100)]
+
+
+class ResumeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workDir = tempfile.mkdtemp()
+        for path in glob.glob(os.path.join(repoDir, '*.py')):
+            shutil.copy(path, cls.workDir)
+        with open(os.path.join(cls.workDir, 'crashrun.py'), 'w', encoding='utf8') as runnerFile:
+            runnerFile.write(crashRunner)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir, ignore_errors=True)
+
+    def runExperiment(self, script, *args, env=None):
+        return subprocess.run([sys.executable, script, '--simulate'] + list(args), cwd=self.workDir,
+                              env=dict(os.environ, **(env or {})), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, timeout=120)
+
+    def clear(self):
+        shutil.rmtree(os.path.join(self.workDir, 'K5_sim'), ignore_errors=True)
+        for path in glob.glob(os.path.join(self.workDir, 'calPrior.sqlite*')):
+            os.remove(path)
+
+    def readData(self):
+        # trials of the schedule, the CSV and the store, rating traces, calibration steps and estimates
+        dataDir = os.path.join(self.workDir, 'K5_sim')
+        csvPath, = [path for path in glob.glob(os.path.join(dataDir, '*.csv'))
+                    if open(path, encoding='utf8').readline() == csvHeader]
+        stem = csvPath[:-len('.csv')]
+        keys = lambda trials: [(str(t['blockType']), int(t['blockCounter']), str(t['bcgColor']), int(t['marker']))
+                               for t in trials]
+        with open(stem + '_SCHEDULE.csv', encoding='utf8') as scheduleFile:
+            next(scheduleFile)  # header
+            schedule = [line.rstrip('\n').split(',') for line in scheduleFile]
+        with open(stem + '_RATINGS.csv', encoding='utf8') as ratingsFile:
+            next(ratingsFile)   # header
+            ratings = [tuple(line.split(',')[:3]) for line in ratingsFile]
+        calRows = readRows(stem + '_CAL.csv')
+        return {'schedule': [(blockType, int(blockCounter), bcgColor, int(marker))
+                             for seed, blockType, blockCounter, trial, bcgColor, marker, colorWait in schedule],
+                'trials': keys(readTrialCSV(csvPath)), 'store': keys(openStore(stem + '.trials')),
+                'ratings': [rating for rating in ratings if rating[0] != 'calibration'],
+                'calRatings': sum(rating[0] == 'calibration' for rating in ratings),
+                'calSteps': [(fields[0], fields[1], fields[3]) for fields in calRows if fields[0].isdigit()],
+                'estimates': [fields[1] for fields in calRows if fields[0] == 'estimate']}
+
+    def testResumeAfterCrash(self):
+        for where, after in crashPoints:
+            with self.subTest(where=where, after=after):
+                self.clear()
+                crashed = self.runExperiment('crashrun.py', env={'CRASH_WHERE': where, 'CRASH_AFTER': str(after)})
+                self.assertEqual(crashed.returncode, 1, crashed.stderr.decode())
+                resumed = self.runExperiment('ColorsPainExpectations.py', '--resume')
+                self.assertEqual(resumed.returncode, 0, resumed.stderr.decode())
+
+                data = self.readData()
+                self.assertEqual(data['trials'], data['schedule'])
+                self.assertEqual(data['store'], data['schedule'])
+                self.assertEqual(data['ratings'], [(blockType, str(blockCounter), bcgColor)
+                                                   for blockType, blockCounter, bcgColor, marker in data['schedule']
+                                                   if blockType != 'colors'])
+                steps = [(series, step) for series, step, VAS in data['calSteps']]
+                self.assertEqual(len(set(steps)), len(steps))
+                self.assertEqual(sorted({series for series, step in steps}), ['1', '2'])
+                self.assertEqual(data['calRatings'], sum(VAS != '' for series, step, VAS in data['calSteps']))
+                self.assertEqual(data['estimates'], ['40', '50', '60'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+StimulationScheduler against a LabJack stand-in (labjackio.DryRunU3) that
+records every feedback transaction.
+
+The simulation backend provides psychopy and the DS8R; core is replaced by
+a manual clock (ManualCore), so the pulse times do not depend on how the
+OS schedules the threads.
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import simulation
+simulation.install()
+
+import stimulation
+from labjackio import DryRunU3, TriggerOutput, eioMask
+
+
+class ManualCore:
+    """core stand-in: wait() moves the time on at once, every getTime() by one tick (so spin loops end)."""
+
+    tick = 1e-5
+
+    def __init__(self):
+        self.t = 0.0
+        self.lock = threading.Lock()
+
+    def getTime(self):
+        with self.lock:
+            self.t += self.tick
+            return self.t
+
+    def wait(self, secs, hogCPUperiod=0):
+        with self.lock:
+            self.t += secs
+
+
+class StimulationSchedulerTest(unittest.TestCase):
+
+    interval = 0.02
+
+    def setUp(self):
+        self.core, stimulation.core = stimulation.core, ManualCore()
+        self.device = DryRunU3(clock=stimulation.core.getTime)
+        self.shock = simulation.DS8R()
+        self.scheduler = stimulation.StimulationScheduler(
+            self.shock, TriggerOutput(self.device), interval=self.interval)
+
+    def tearDown(self):
+        self.scheduler.close()
+        stimulation.core = self.core
+
+    def testStartDoesNotBlock(self):
+        # the DS8R holds the first pulse until released: start() returns in the meantime
+        release = threading.Event()
+        self.shock.run = lambda: release.wait(2)
+        train = self.scheduler.start(30, 5)
+        self.assertFalse(train.done.is_set())
+        release.set()
+        self.assertTrue(train.wait(2))
+        self.assertEqual(len(train.pulseTs), 5)
+
+    def testPulses(self):
+        train = self.scheduler.start(30, 5)
+        self.assertTrue(train.wait(2))
+        # first pulse from the DS8R, the others one trigger transaction each
+        self.assertEqual(len(train.pulseTs), 5)
+        self.assertEqual([demand for t, demand in self.shock.pulses], [30])
+        self.assertEqual(len(self.device.transactions), 4)
+        for t, commands in self.device.transactions:
+            rise, width, fall = commands
+            self.assertEqual(rise.State, eioMask)
+            self.assertEqual(fall.State, [0, 0, 0])
+
+    def testPulseSpacing(self):
+        train = self.scheduler.start(30, 5)
+        self.assertTrue(train.wait(2))
+        # on the grid start + i * interval, never early; late by a few clock ticks at most
+        lateness = np.array(train.pulseTs) - (train.pulseTs[0] + self.interval * np.arange(5))
+        self.assertTrue(np.all(lateness >= 0))
+        np.testing.assert_allclose(lateness, 0, atol=100 * ManualCore.tick)
+        # every trigger transaction right after its timestamp
+        transactionTs = np.array([t for t, commands in self.device.transactions])
+        self.assertTrue(np.all(transactionTs >= train.pulseTs[1:]))
+        np.testing.assert_allclose(transactionTs - train.pulseTs[1:], 0, atol=100 * ManualCore.tick)
+
+    def testTrainsInOrder(self):
+        trains = [self.scheduler.start(demand, 3) for demand in (10, 20)]
+        self.assertTrue(trains[1].wait(2))
+        self.assertTrue(trains[0].done.is_set())
+        self.assertGreaterEqual(trains[1].pulseTs[0], trains[0].pulseTs[0] + 3 * self.interval)     # after the interval of the last pulse
+        self.assertEqual([demand for t, demand in self.shock.pulses], [10, 20])
+
+    def testWithoutLabJack(self):
+        scheduler = stimulation.StimulationScheduler(self.shock, TriggerOutput(self.device), labjack=False)
+        train = scheduler.start(30, 5)
+        scheduler.close()
+        self.assertTrue(train.done.is_set())
+        self.assertEqual(self.device.transactions, [])
+        self.assertEqual(self.shock.pulses, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
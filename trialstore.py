@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Fixed-schema binary trial store, written next to the trial CSV.
+
+Every trial is one fixed-size record of trialDtype (NumPy structured dtype)
+appended to <data file>.trials after a short header. Reading is a memory map
+of the file, so loading every trial of every participant parses no text:
+    trials = loadDirectory('K5_data')
+    trials[trials['blockType'] == 'intensity']['VAS']
+
+Missing ratings (colors only blocks) are stored as NaN. Text longer than its
+field (e.g. a subID of more than 16 characters) raises ValueError when a
+record is written, instead of being truncated. readTrialCSV() widens the
+text fields as needed, so the CSV tools do not depend on the store; the
+backfill skips such files. Run this file to
+backfill a .trials file for every trial CSV in K5_data that has none:
+    python trialstore.py [data directory]
+"""
+import glob
+import os
+import sys
+
+import numpy as np
+
+storeHeader = b'K5TRIALS v1\n\0\0\0\0'     # 16 bytes; changes if trialDtype changes
+
+trialDtype = np.dtype([
+    ('subID', 'U16'),
+    ('group', 'U12'),
+    ('blockType', 'U20'),
+    ('blockCounter', 'i2'),
+    ('bcgColor', 'U8'),
+    ('marker', 'i2'),
+    ('VAS', 'f4'),
+])
+
+# Header of the trial CSV (session.py); other CSV files in the data folder are skipped
+csvHeader = 'group, blockType, blockCounter, bcgColor, marker, VAS\n'
+
+
+def storePath(csvPath):
+    return csvPath[:-len('.csv')] + '.trials'
+
+def createStore(path):
+    # new, empty store (overwrites)
+    with open(path, 'wb') as storeFile:
+        storeFile.write(storeHeader)
+
+def checkText(**fields):
+    # raise ValueError if a text field does not fit trialDtype (numpy would silently truncate it)
+    for name, value in fields.items():
+        width = trialDtype[name].itemsize // 4     # 4 bytes per character
+        if len(value) > width:
+            raise ValueError('%s %r is longer than %i characters, the trial store limit' % (name, value, width))
+
+def trialRecord(subID, group, blockType, blockCounter, bcgColor, marker, VAS):
+    # one trial as bytes, ready to append to a store; marker may be '02' or 31, VAS None
+    checkText(subID=subID, group=group, blockType=blockType, bcgColor=bcgColor)
+    record = np.array([(subID, group, blockType, blockCounter, bcgColor, int(marker),
+                        np.nan if VAS is None else VAS)], dtype=trialDtype)
+    return record.tobytes()
+
+def openStore(path):
+    # read-only memory map of the trials in a store
+    with open(path, 'rb') as storeFile:
+        if storeFile.read(len(storeHeader)) != storeHeader:
+            raise ValueError('%s is not a trial store (or was written with another schema)' % path)
+    nrTrials = (os.path.getsize(path) - len(storeHeader)) // trialDtype.itemsize
+    if nrTrials == 0:
+        return np.empty(0, dtype=trialDtype)   # numpy cannot map an empty region
+    return np.memmap(path, dtype=trialDtype, mode='r', offset=len(storeHeader), shape=(nrTrials,))
+
+def loadDirectory(dataDir):
+    # all trials of all participants in dataDir
+    stores = [openStore(path) for path in sorted(glob.glob(os.path.join(dataDir, '*.trials')))]
+    if not stores:
+        return np.empty(0, dtype=trialDtype)
+    return np.concatenate(stores)
+
+###############################################################################
+# %% Backfill from the CSV files
+###############################################################################
+
+def readTrialCSV(path):
+    # trials of a legacy trial CSV; the participant ID is the file name up to the first '_'
+    # text fields longer than in trialDtype are widened, not truncated
+    subID = os.path.basename(path).split('_')[0]
+    rows = []
+    with open(path, encoding='utf8') as csvFile:
+        next(csvFile)   # header
+        for line in csvFile:
+            fields = line.rstrip('\n').split(',')
+            if len(fields) != 6:
+                continue
+            group, blockType, blockCounter, bcgColor, marker, VAS = fields
+            rows.append((subID, group, blockType, int(blockCounter), bcgColor, int(marker),
+                         np.nan if VAS == 'None' else float(VAS)))
+    return np.array(rows, dtype=fittedDtype(rows))
+
+def fittedDtype(rows):
+    # trialDtype with every text field as wide as its longest value in rows
+    fields = []
+    for i, name in enumerate(trialDtype.names):
+        kind = trialDtype[name]
+        if kind.kind == 'U':
+            width = max([kind.itemsize // 4] + [len(row[i]) for row in rows])
+            kind = np.dtype('U%i' % width)
+        fields.append((name, kind))
+    return np.dtype(fields)
+
+def isTrialCSV(path):
+    with open(path, encoding='utf8') as csvFile:
+        return csvFile.readline() == csvHeader
+
+def backfillDirectory(dataDir, overwrite=False):
+    # write a .trials file for every trial CSV without one; returns the paths written
+    written = []
+    for csvPath in sorted(glob.glob(os.path.join(dataDir, '*.csv'))):
+        if not isTrialCSV(csvPath):
+            continue
+        path = storePath(csvPath)
+        if os.path.exists(path) and not overwrite:
+            continue
+        trials = readTrialCSV(csvPath)
+        if trials.dtype != trialDtype:
+            print('Skipped %s: text longer than the fields of the trial store' % csvPath)
+            continue
+        createStore(path)
+        with open(path, 'ab') as storeFile:
+            storeFile.write(trials.tobytes())
+        written.append(path)
+    return written
+
+
+if __name__ == '__main__':
+    dataDir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'K5_data')
+    written = backfillDirectory(dataDir)
+    for path in written:
+        print('Saved', path)
+    print('%i trials in %s' % (len(loadDirectory(dataDir)), dataDir))